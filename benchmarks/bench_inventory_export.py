@@ -0,0 +1,130 @@
+"""
+Benchmark the columnar inventory export against the original per-item DictWriter export.
+
+    python benchmarks/bench_inventory_export.py --items 100000
+
+Generates a synthetic catalog shaped like the /item API response, writes it with both
+implementations, checks the two CSVs are identical and prints the timings.
+"""
+import os
+import sys
+import csv
+import time
+import random
+import filecmp
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from get_inventory import export_inventory_stream, parse_prices, get_large_images, PAGE_SIZE
+
+PRICE_KEYS = ["MSRP", "MAP", "Cost", "Wholesale", "Sale", "Clearance"]
+
+def generate_catalog(count, seed=0):
+    rng = random.Random(seed)
+    items = []
+    for i in range(count):
+        items.append({
+            "itemcode": f"IC{i:07d}",
+            "sku": f"SKU-{i:07d}",
+            "name": f"Item {i} \"deluxe\", size {rng.randint(1, 12)}",
+            "color": rng.choice(["Black", "White", "Red", "Navy"]),
+            "upc": f"{rng.randrange(10**11, 10**12)}",
+            "size": rng.choice(["S", "M", "L", "XL"]),
+            "sizeNum": rng.randint(1, 12),
+            "ModelCode": f"M{i // 8}",
+            "GroupCode": f"G{i // 200}",
+            "active": True,
+            "description": "Lorem ipsum dolor sit amet, " * rng.randint(1, 6),
+            "brand": rng.choice(["Wilson", "Babolat", "Head", "Yonex"]),
+            "url": f"https://example.com/items/{i}",
+            "inventory": rng.randint(0, 500),
+            "prices": [
+                {"key": key, "value": round(rng.uniform(5, 300), 2)}
+                for key in rng.sample(PRICE_KEYS, rng.randint(1, len(PRICE_KEYS)))
+            ],
+            "images": {"LARGE": [f"https://img.example.com/{i}/{n}.jpg" for n in range(rng.randint(0, 5))]},
+        })
+    return items
+
+def legacy_export_inventory_to_csv(items, filename):
+    """
+    The export as it was before the streaming/columnar rewrite, kept here as the baseline.
+    """
+    processed_items = []
+    all_price_keys = set()
+    max_image_count = 0
+
+    for item in items:
+        price_dict = parse_prices(item.get("prices", []))
+        all_price_keys.update(price_dict.keys())
+        large_images = get_large_images(item.get("images", {}))
+        if len(large_images) > max_image_count:
+            max_image_count = len(large_images)
+        processed = {key: item.get(key, "") for key in [
+            "itemcode", "sku", "name", "color", "upc", "size", "sizeNum",
+            "ModelCode", "GroupCode", "active", "description", "brand", "url", "inventory"]}
+        processed["prices"] = price_dict
+        processed["large_images"] = large_images
+        processed_items.append(processed)
+
+    price_columns = sorted(all_price_keys)
+    fieldnames = [
+        "itemcode", "sku", "name", "color", "upc", "size", "sizeNum",
+        "ModelCode", "GroupCode", "active", "description", "brand", "url", "inventory"
+    ]
+    fieldnames.extend(price_columns)
+    for i in range(max_image_count):
+        fieldnames.append(f"image{i+1}")
+
+    with open(filename, mode="w", newline="", encoding="utf-8") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer.writeheader()
+        for processed_item in processed_items:
+            row = {}
+            for key in ["itemcode", "sku", "name", "color", "upc", "size", "sizeNum",
+                        "ModelCode", "GroupCode", "active", "description", "brand", "url", "inventory"]:
+                row[key] = processed_item.get(key, "")
+            for price_key in price_columns:
+                row[price_key] = processed_item["prices"].get(price_key, "")
+            large_images = processed_item["large_images"]
+            for i in range(max_image_count):
+                col_name = f"image{i+1}"
+                row[col_name] = large_images[i] if i < len(large_images) else ""
+            writer.writerow(row)
+
+def best_of(repeat, func, *args):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--items', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"generating {args.items} items...")
+    items = generate_catalog(args.items)
+    pages = [items[i:i + PAGE_SIZE] for i in range(0, len(items), PAGE_SIZE)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_csv = os.path.join(tmp, "legacy.csv")
+        columnar_csv = os.path.join(tmp, "columnar.csv")
+
+        legacy = best_of(args.repeat, legacy_export_inventory_to_csv, items, legacy_csv)
+        columnar = best_of(args.repeat, lambda: export_inventory_stream(iter(pages), columnar_csv))
+
+        if not filecmp.cmp(legacy_csv, columnar_csv, shallow=False):
+            sys.exit("columnar export does not match the legacy export")
+
+    print(f"legacy DictWriter export: {legacy:.2f}s ({args.items / legacy:,.0f} items/s)")
+    print(f"columnar stream export:   {columnar:.2f}s ({args.items / columnar:,.0f} items/s)")
+    print(f"speedup: {legacy / columnar:.2f}x")
+
+if __name__ == '__main__':
+    main()
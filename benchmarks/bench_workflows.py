@@ -0,0 +1,229 @@
+"""
+End-to-end benchmarks for the bot's workflows, run against local stand-ins for the Fromuth API,
+the FTP server and the tracking sheet (see benchmarks/fakes.py), so no credentials or network
+access are needed.
+
+    python benchmarks/bench_workflows.py --size small --latency 0.02
+    python benchmarks/bench_workflows.py --size large --save-baseline
+    python benchmarks/bench_workflows.py --size large --threshold 0.2
+
+Each scenario is run `--repeat` times and its median wall time reported. --save-baseline writes
+the results to benchmarks/baseline.json; --threshold compares against that file and exits 1 if
+any scenario is more than that fraction slower than its baseline.
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import shutil
+import tempfile
+import statistics
+import contextlib
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(BENCH_DIR, 'baseline.json')
+WORK_DIR = tempfile.mkdtemp(prefix='fromuth-bench-')
+
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fakes import FakeApiServer, FakeFtpServer, FakeSheet, random_orders_csv
+
+SIZES = {
+    'small': {'items': 2000, 'orders': 20, 'tracking_rows': 100, 'ftp_files': 5, 'upload_mb': 1},
+    'large': {'items': 20000, 'orders': 200, 'tracking_rows': 1000, 'ftp_files': 20, 'upload_mb': 10},
+}
+
+def configure_env(api, ftp):
+    """
+    Point the bot at the fakes. Must run before any bot module is imported, since they read
+    their settings at import time.
+    """
+    orders_dir = os.path.join(WORK_DIR, 'orders')
+    os.makedirs(orders_dir, exist_ok=True)
+    os.environ.update({
+        'API_BASE_URL': api.url,
+        'API_USERNAME': 'bench',
+        'API_PASSWORD': 'bench',
+        'FTP_HOST': '127.0.0.1',
+        'FTP_PORT': str(ftp.port),
+        'FTP_USER': 'bench',
+        'FTP_PASS': 'bench',
+        'LOCAL_ORDERS_DIR': orders_dir,
+        'STATE_DIR': os.path.join(WORK_DIR, 'state'),
+        'JWT_CACHE_FILE': '',
+    })
+
+def bench_inventory(api, size, concurrency):
+    from utils.auth_utils import get_jwt
+    from get_inventory import fetch_all_inventory
+
+    token = get_jwt()
+    def run():
+        items = fetch_all_inventory(token, concurrency=concurrency)
+        assert len(items) == size['items'], f"fetched {len(items)} of {size['items']} items"
+    return run
+
+def bench_orders(api, size, sheet_latency):
+    from utils.auth_utils import get_jwt
+    from utils.ftp_utils import LOCAL_ORDERS_DIR
+    from utils.order_ledger import OrderLedger
+    from post_orders import process_order_file
+
+    headers = {'Authorization': f'Bearer {get_jwt()}'}
+    archive_dir = os.path.join(LOCAL_ORDERS_DIR, 'processed')
+    os.makedirs(archive_dir, exist_ok=True)
+    runs = iter(range(1, 1000))
+    def run():
+        # new PO numbers and an empty ledger every time, so every order is really placed
+        seed = next(runs)
+        file = f'bench_orders_{seed}.csv'
+        random_orders_csv(os.path.join(LOCAL_ORDERS_DIR, file), size['orders'], seed=seed)
+        sheet = FakeSheet(latency=sheet_latency)
+        ledger = OrderLedger(f'bench_ledger_{seed}_{os.getpid()}')
+        successful, failed = [], []
+        try:
+            process_order_file(file, headers, archive_dir, successful, failed, sheet=sheet, ledger=ledger)
+        finally:
+            ledger.close()
+        assert len(successful) == size['orders'] and not failed, f"{len(failed)} orders failed"
+    return run
+
+def bench_tracking(api, size, sheet_latency):
+    from utils.auth_utils import get_jwt
+    from get_tracking import update_sheet_with_tracking
+
+    headers = {'Authorization': f'Bearer {get_jwt()}'}
+    rng = random.Random(0)
+    rows = [["Flip PO", "Fromuth Order", "Carrier", "Tracking"]]
+    for i in range(size['tracking_rows']):
+        po_num = f'TRACK{i:06d}'
+        rows.append([po_num, f'F{i:08d}'])
+        # about half the orders have shipped
+        shipped = rng.random() < 0.5
+        api.orders[po_num] = {
+            'order_number': f'F{i:08d}', 'customer_order_number': po_num, 'state': 'SHIPPED' if shipped else 'OPEN',
+            'tracking_numbers': [f'1Z{i:016d}'] if shipped else [],
+            'documents': [{'shipping_method_name': 'UPS Ground'}] if shipped else [],
+        }
+    def run():
+        sheet = FakeSheet(rows, latency=sheet_latency)
+        update_sheet_with_tracking(sheet, headers)
+    return run
+
+def bench_ftp_download(ftp, size):
+    from utils.ftp_utils import download_order_files, REMOTE_ORDERS_DIR
+
+    ftp.dirs.update({'/out', REMOTE_ORDERS_DIR})
+    runs = iter(range(1, 1000))
+    def run():
+        seed = next(runs)
+        names = []
+        for n in range(size['ftp_files']):
+            path = os.path.join(WORK_DIR, 'ftp_order.csv')
+            random_orders_csv(path, 50, seed=seed * 1000 + n)
+            with open(path, 'rb') as f:
+                ftp.put(f'{REMOTE_ORDERS_DIR}/bench_{seed}_{n}.csv', f.read())
+            names.append(f'bench_{seed}_{n}.csv')
+        downloaded = download_order_files()
+        assert sorted(downloaded) == sorted(names), f"downloaded {downloaded}"
+    return run
+
+def bench_ftp_upload(ftp, size):
+    from utils.ftp_utils import connect_ftp, upload_files, REMOTE_INVENTORY_DIR
+
+    ftp.dirs.update({'/in', REMOTE_INVENTORY_DIR})
+    local_path = os.path.join(WORK_DIR, 'upload.csv')
+    runs = iter(range(1, 1000))
+    def run():
+        # different content every run so the unchanged-upload check never skips it
+        with open(local_path, 'wb') as f:
+            f.write(f'run {next(runs)}\n'.encode())
+            f.write(os.urandom(size['upload_mb'] * 1024 * 1024))
+        conn = connect_ftp()
+        try:
+            assert upload_files(conn, local_path, 'inventory.csv', gzip_copy=False)
+        finally:
+            conn.quit()
+    return run
+
+def time_scenario(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        # the bot is chatty; keep its output out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def compare(results, baseline, threshold):
+    """
+    Print each scenario against its baseline and return the names of the ones that regressed.
+    """
+    regressions = []
+    for name, seconds in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<22} {seconds:8.3f}s   (no baseline)")
+            continue
+        change = seconds / base - 1
+        regressed = change > threshold
+        print(f"{name:<22} {seconds:8.3f}s   baseline {base:8.3f}s   {change:+7.1%}{'   REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bot's workflows against local fakes.")
+    parser.add_argument('--size', choices=sorted(SIZES), default='small')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to every API request')
+    parser.add_argument('--sheet-latency', type=float, default=0.1, help='seconds added to every sheet call')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save-baseline', action='store_true', help=f'write the results to {BASELINE_FILE}')
+    parser.add_argument('--threshold', type=float, help='fail if a scenario is this fraction slower than its baseline')
+    args = parser.parse_args()
+
+    size = SIZES[args.size]
+    logging.disable(logging.CRITICAL)
+    with FakeApiServer(latency=args.latency) as api, FakeFtpServer() as ftp:
+        configure_env(api, ftp)
+        from bench_inventory_export import generate_catalog
+        api.catalog = generate_catalog(size['items'])
+        scenarios = {
+            'inventory_serial': bench_inventory(api, size, concurrency=1),
+            'inventory_concurrent': bench_inventory(api, size, concurrency=4),
+            'orders': bench_orders(api, size, args.sheet_latency),
+            'tracking': bench_tracking(api, size, args.sheet_latency),
+            'ftp_download': bench_ftp_download(ftp, size),
+            'ftp_upload': bench_ftp_upload(ftp, size),
+        }
+        print(f"size={args.size} latency={args.latency}s sheet_latency={args.sheet_latency}s repeat={args.repeat}")
+        results = {}
+        for name, run in scenarios.items():
+            results[name] = time_scenario(run, args.repeat)
+        print(f"{api.request_count} API requests served")
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+    key = f"{args.size}@{args.latency}/{args.sheet_latency}"
+    baselines = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baselines = json.load(f)
+    regressions = compare(results, baselines.get(key, {}), args.threshold if args.threshold is not None else float('inf'))
+
+    if args.save_baseline:
+        baselines[key] = {name: round(seconds, 4) for name, seconds in results.items()}
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"Saved baseline for {key} to {BASELINE_FILE}")
+
+    if regressions:
+        print(f"Regressed: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
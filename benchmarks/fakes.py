@@ -0,0 +1,431 @@
+"""
+Local stand-ins for the systems the bot talks to, for benchmarks:
+
+- FakeApiServer: HTTP server implementing /auth/login, /item and /order with configurable latency.
+- FakeFtpServer: small in-process FTP server backed by an in-memory filesystem.
+- FakeSmtpServer: SMTP server that records the messages it receives.
+- FakeSheet: in-memory replacement for the gspread worksheet.
+"""
+import re
+import json
+import email
+import time
+import base64
+import random
+import socket
+import threading
+import posixpath
+import socketserver
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+def make_jwt(ttl=3600):
+    header = base64.urlsafe_b64encode(b'{"alg":"none"}').decode().rstrip('=')
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": time.time() + ttl}).encode()).decode().rstrip('=')
+    return f"{header}.{payload}.sig"
+
+class FakeApiServer:
+    """
+    Serves the Fromuth API endpoints the bot uses from memory.
+    `catalog` is the list of items returned by /item, paged like the real API. Orders placed
+    through POST /order can be looked up by customer order number, and `orders` can be
+    pre-filled with {customer_order_number: order} for tracking benchmarks.
+    """
+
+    def __init__(self, catalog=(), latency=0.0):
+        self.catalog = list(catalog)
+        self.latency = latency
+        self.orders = {}
+        self.request_count = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body go out as separate writes; without this, delayed ACKs add ~40ms per request
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return json.loads(self.rfile.read(length) or b'{}')
+
+            def _begin(self):
+                with api.lock:
+                    api.request_count += 1
+                if api.latency:
+                    time.sleep(api.latency)
+                url = urlsplit(self.path)
+                return url.path, {k: v[0] for k, v in parse_qs(url.query).items()}
+
+            def do_POST(self):
+                path, _ = self._begin()
+                body = self._body()
+                if path == '/auth/login':
+                    return self._send(200, {"data": {"jwt": {"token": make_jwt()}}})
+                if path == '/order':
+                    po_num = body['customer_order_number']
+                    with api.lock:
+                        order_number = f"F{len(api.orders) + 1:08d}"
+                        api.orders[po_num] = {"order_number": order_number, "customer_order_number": po_num,
+                                              "state": "OPEN", "tracking_numbers": [], "documents": []}
+                    return self._send(200, {"data": {"order_number": order_number, "customer_order_number": po_num}})
+                self._send(404, {"title": "Not Found", "status": 404})
+
+            def do_GET(self):
+                path, params = self._begin()
+                if path == '/item':
+                    page_no = int(params.get('page_no', 0))
+                    page_size = int(params.get('page_size', 500))
+                    items = api.catalog[page_no * page_size:(page_no + 1) * page_size]
+                    select = params.get('select')
+                    if select:
+                        fields = select.split(',')
+                        items = [{k: item[k] for k in fields if k in item} for item in items]
+                    return self._send(200, {"_embedded": {"items": items}})
+                match = re.fullmatch(r'/order/(.+)', path)
+                if match:
+                    order = api.orders.get(match.group(1))
+                    if order:
+                        return self._send(200, {"_embedded": {"order": order}})
+                    return self._send(404, {"title": "Order not found", "status": 404, "code": "not_found"})
+                self._send(404, {"title": "Not Found", "status": 404})
+
+        return Handler
+
+class FakeFtpServer:
+    """
+    Minimal passive-mode FTP server with an in-memory filesystem (`files`: path -> bytes).
+    Supports what ftplib and utils.ftp_utils use: USER/PASS, TYPE, PWD, CWD, MKD, NLST, MLSD,
+    SIZE, MDTM, REST, RETR, STOR, RNFR/RNTO, DELE, OPTS, NOOP and QUIT.
+    """
+
+    def __init__(self, dirs=('/',)):
+        self.files = {}
+        self.mtimes = {}
+        self.dirs = set(dirs) | {'/'}
+        self.lock = threading.Lock()
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def put(self, path, data):
+        with self.lock:
+            self.files[path] = data
+            self.mtimes[path] = time.gmtime()
+
+    def _handler(self):
+        ftp = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            disable_nagle_algorithm = True
+
+            def reply(self, line):
+                self.wfile.write(f"{line}\r\n".encode())
+
+            def path(self, arg):
+                return posixpath.normpath(posixpath.join(self.cwd, arg)) if arg else self.cwd
+
+            def open_data(self):
+                conn, _ = self.pasv.accept()
+                self.pasv.close()
+                self.pasv = None
+                return conn
+
+            def listing(self, directory):
+                prefix = directory.rstrip('/') + '/'
+                with ftp.lock:
+                    return sorted(
+                        (name[len(prefix):], data, ftp.mtimes[name]) for name, data in ftp.files.items()
+                        if name.startswith(prefix) and '/' not in name[len(prefix):]
+                    )
+
+            def handle(self):
+                self.cwd = '/'
+                self.pasv = None
+                self.rest = 0
+                self.rename_from = None
+                self.reply("220 fake ftp ready")
+                for raw in self.rfile:
+                    line = raw.decode().rstrip('\r\n')
+                    cmd, _, arg = line.partition(' ')
+                    cmd = cmd.upper()
+                    handler = getattr(self, f"ftp_{cmd}", None)
+                    if handler is None:
+                        self.reply(f"502 {cmd} not implemented")
+                        continue
+                    if handler(arg) is False:
+                        return
+
+            def ftp_USER(self, arg): self.reply("331 password please")
+            def ftp_PASS(self, arg): self.reply("230 logged in")
+            def ftp_TYPE(self, arg): self.reply("200 type set")
+            def ftp_NOOP(self, arg): self.reply("200 ok")
+            def ftp_OPTS(self, arg): self.reply("200 ok")
+            def ftp_PWD(self, arg): self.reply(f'257 "{self.cwd}"')
+
+            def ftp_QUIT(self, arg):
+                self.reply("221 bye")
+                return False
+
+            def ftp_CWD(self, arg):
+                path = self.path(arg)
+                if path in ftp.dirs:
+                    self.cwd = path
+                    self.reply("250 ok")
+                else:
+                    self.reply("550 no such directory")
+
+            def ftp_MKD(self, arg):
+                path = self.path(arg)
+                ftp.dirs.add(path)
+                self.reply(f'257 "{path}" created')
+
+            def ftp_PASV(self, arg):
+                self.pasv = socket.socket()
+                self.pasv.bind(('127.0.0.1', 0))
+                self.pasv.listen(1)
+                port = self.pasv.getsockname()[1]
+                self.reply(f"227 Entering Passive Mode (127,0,0,1,{port >> 8},{port & 0xff})")
+
+            def ftp_NLST(self, arg):
+                names = [name for name, _, _ in self.listing(self.path(arg))]
+                self.reply("150 listing")
+                with self.open_data() as conn:
+                    conn.sendall("".join(f"{name}\r\n" for name in names).encode())
+                self.reply("226 done")
+
+            def ftp_MLSD(self, arg):
+                entries = self.listing(self.path(arg))
+                self.reply("150 listing")
+                with self.open_data() as conn:
+                    conn.sendall("".join(
+                        f"type=file;size={len(data)};modify={time.strftime('%Y%m%d%H%M%S', mtime)}; {name}\r\n"
+                        for name, data, mtime in entries
+                    ).encode())
+                self.reply("226 done")
+
+            def ftp_SIZE(self, arg):
+                data = ftp.files.get(self.path(arg))
+                self.reply(f"213 {len(data)}" if data is not None else "550 no such file")
+
+            def ftp_MDTM(self, arg):
+                mtime = ftp.mtimes.get(self.path(arg))
+                self.reply(f"213 {time.strftime('%Y%m%d%H%M%S', mtime)}" if mtime else "550 no such file")
+
+            def ftp_REST(self, arg):
+                self.rest = int(arg)
+                self.reply(f"350 restarting at {self.rest}")
+
+            def ftp_RETR(self, arg):
+                data = ftp.files.get(self.path(arg))
+                if data is None:
+                    self.reply("550 no such file")
+                    return
+                offset, self.rest = self.rest, 0
+                self.reply("150 sending")
+                with self.open_data() as conn:
+                    conn.sendall(data[offset:])
+                self.reply("226 done")
+
+            def ftp_STOR(self, arg):
+                self.reply("150 ready")
+                chunks = []
+                with self.open_data() as conn:
+                    while True:
+                        chunk = conn.recv(256 * 1024)
+                        if not chunk:
+                            break
+                        chunks.append(chunk)
+                ftp.put(self.path(arg), b"".join(chunks))
+                self.reply("226 stored")
+
+            def ftp_DELE(self, arg):
+                with ftp.lock:
+                    found = ftp.files.pop(self.path(arg), None) is not None
+                self.reply("250 deleted" if found else "550 no such file")
+
+            def ftp_RNFR(self, arg):
+                self.rename_from = self.path(arg)
+                self.reply("350 ready for RNTO" if self.rename_from in ftp.files else "550 no such file")
+
+            def ftp_RNTO(self, arg):
+                with ftp.lock:
+                    ftp.files[self.path(arg)] = ftp.files.pop(self.rename_from)
+                    ftp.mtimes[self.path(arg)] = ftp.mtimes.pop(self.rename_from)
+                self.reply("250 renamed")
+
+        return Handler
+
+class FakeSmtpServer:
+    """
+    Plain-text SMTP server that keeps every received message in `messages` (parsed
+    email.message.Message objects). `connections` counts SMTP sessions opened.
+    Point the bot at it with SMTP_HOST=127.0.0.1, SMTP_PORT=<port> and SMTP_STARTTLS=false.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        smtp = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            disable_nagle_algorithm = True
+
+            def reply(self, line):
+                self.wfile.write(f"{line}\r\n".encode())
+
+            def handle(self):
+                with smtp.lock:
+                    smtp.connections += 1
+                self.reply("220 fake smtp ready")
+                for raw in self.rfile:
+                    cmd = raw.decode().strip().split(' ', 1)[0].upper()
+                    if cmd in ('HELO', 'EHLO'):
+                        self.reply("250 fake smtp")
+                    elif cmd == 'DATA':
+                        self.reply("354 end with .")
+                        lines = []
+                        for data_line in self.rfile:
+                            if data_line in (b".\r\n", b".\n"):
+                                break
+                            lines.append(data_line[1:] if data_line.startswith(b"..") else data_line)
+                        with smtp.lock:
+                            smtp.messages.append(email.message_from_bytes(b"".join(lines)))
+                        self.reply("250 queued")
+                    elif cmd == 'QUIT':
+                        self.reply("221 bye")
+                        return
+                    else:  # MAIL, RCPT, RSET, NOOP
+                        self.reply("250 ok")
+
+        return Handler
+
+class FakeSheet:
+    """
+    In-memory stand-in for the gspread worksheet methods used by the bot.
+    `latency` is added to every call to mimic the Sheets API round trip.
+    """
+
+    def __init__(self, rows=None, latency=0.0):
+        self.rows = [list(row) for row in (rows or [["Flip PO", "Fromuth Order", "Carrier", "Tracking"]])]
+        self.latency = latency
+        self.calls = 0
+
+    def _call(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _cell_range(self, range_str):
+        match = re.fullmatch(r'([A-Z]+)(\d+)(?::([A-Z]+)(\d*))?', range_str)
+        col = lambda letters: sum((ord(c) - 64) * 26 ** i for i, c in enumerate(reversed(letters)))
+        first_col, first_row = col(match.group(1)), int(match.group(2))
+        last_col = col(match.group(3)) if match.group(3) else first_col
+        last_row = int(match.group(4)) if match.group(4) else (first_row if not match.group(3) else len(self.rows))
+        return first_row, first_col, last_row, last_col
+
+    def _set(self, row, col, value):
+        while len(self.rows) < row:
+            self.rows.append([])
+        cells = self.rows[row - 1]
+        while len(cells) < col:
+            cells.append("")
+        cells[col - 1] = value
+
+    def get_all_values(self):
+        self._call()
+        return [list(row) for row in self.rows]
+
+    def get(self, range_str):
+        self._call()
+        first_row, first_col, last_row, last_col = self._cell_range(range_str)
+        return [
+            [(row[c - 1] if c - 1 < len(row) else "") for c in range(first_col, last_col + 1)]
+            for row in self.rows[first_row - 1:last_row]
+        ]
+
+    def col_values(self, col):
+        self._call()
+        return [row[col - 1] for row in self.rows if len(row) >= col and row[col - 1] != ""]
+
+    def update_cell(self, row, col, value):
+        self._call()
+        self._set(row, col, value)
+
+    def update(self, range_str, values):
+        self._call()
+        first_row, first_col, _, _ = self._cell_range(range_str)
+        for r, row in enumerate(values):
+            for c, value in enumerate(row):
+                self._set(first_row + r, first_col + c, value)
+
+    def batch_update(self, data, **kwargs):
+        self._call()
+        for update in data:
+            first_row, first_col, _, _ = self._cell_range(update['range'])
+            for r, row in enumerate(update['values']):
+                for c, value in enumerate(row):
+                    self._set(first_row + r, first_col + c, value)
+
+    def append_rows(self, values, **kwargs):
+        self._call()
+        self.rows.extend(list(row) for row in values)
+
+def random_orders_csv(path, po_count, lines_per_po=2, seed=0):
+    """
+    Write an order CSV in the Flip Shop export layout with `po_count` POs.
+    """
+    rng = random.Random(seed)
+    header = "PO_num,First Name,Last Name,Ship To Address,Ship To Address 2,Ship To City,Ship To State,Ship To Zip,SKU,QTY\n"
+    with open(path, 'w') as f:
+        f.write(header)
+        for po in range(po_count):
+            for _ in range(lines_per_po):
+                f.write(f"BENCH{seed:03d}{po:06d},Pat,Lee,1 Main St,,Springfield,IL,62701,"
+                        f"SKU-{rng.randrange(100000):07d},{rng.randint(1, 3)}\n")
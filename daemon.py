@@ -0,0 +1,85 @@
+from utils.job_utils import job_lock, run_reported_job
+from main import build_jobs, JOB_TIMEOUTS
+from watch_orders import OrderWatcher, ORDER_POLL_INTERVAL
+from utils.stock_check import enable_background_refresh
+from dotenv import load_dotenv
+import threading
+import signal
+import time
+import sys
+import os
+
+load_dotenv()
+
+# seconds between the starts of consecutive runs of each job
+JOB_INTERVALS = {
+    'orders': ORDER_POLL_INTERVAL,
+    'tracking': int(os.getenv('TRACKING_INTERVAL', '3600')),
+    # quantity-only stock refreshes run often, inside ORDER_STOCK_MAX_AGE; the full content export daily
+    'stock': int(os.getenv('STOCK_INTERVAL', '600')),
+    'inventory': int(os.getenv('INVENTORY_INTERVAL', '86400')),
+}
+SHUTDOWN_GRACE = 120  # seconds to wait for running jobs after a stop signal
+
+stop_event = threading.Event()
+
+def handle_stop_signal(signum, frame):
+    print(f"received signal {signum}, shutting down after running jobs finish")
+    stop_event.set()
+
+def run_scheduler(jobs, intervals):
+    """
+    Start each job on its own thread every `intervals[name]` seconds until stop_event is set.
+    A job whose previous run is still going is not started again; a run that goes past its
+    JOB_TIMEOUTS entry is reported once so a hung job is visible in the logs.
+    API session, JWT and google sheet session stay warm in this process between runs; the
+    metrics are not, each run gets its own and writes its own report.
+    """
+    next_run = {name: time.monotonic() for name in jobs}
+    running = {}  # name -> (thread, started_at, timeout_reported)
+
+    while not stop_event.is_set():
+        now = time.monotonic()
+        for name, func in jobs.items():
+            if name in running:
+                thread, started_at, reported = running[name]
+                if not thread.is_alive():
+                    del running[name]
+                elif not reported and now - started_at > JOB_TIMEOUTS[name]:
+                    print(f"job {name} has been running for {now - started_at:.0f}s (timeout {JOB_TIMEOUTS[name]}s)")
+                    running[name] = (thread, started_at, True)
+                continue
+            if now < next_run[name]:
+                continue
+
+            next_run[name] = now + intervals[name]
+            thread = threading.Thread(target=lambda n=name, f=func: print(f"job {run_reported_job(n, f)}"),
+                                      name=f'job-{name}', daemon=True)
+            thread.start()
+            running[name] = (thread, now, False)
+
+        stop_event.wait(1.0)
+
+    deadline = time.monotonic() + SHUTDOWN_GRACE
+    for thread, _, _ in running.values():
+        thread.join(max(0, deadline - time.monotonic()))
+
+def main():
+    signal.signal(signal.SIGTERM, handle_stop_signal)
+    signal.signal(signal.SIGINT, handle_stop_signal)
+
+    with job_lock('daemon') as acquired:
+        if not acquired:
+            print("another fromuthbot daemon is already running")
+            return False
+        print(f"daemon started with intervals {JOB_INTERVALS}")
+        jobs = build_jobs(list(JOB_INTERVALS))
+        # orders are picked up by the cheap FTP watcher instead of a full download pass
+        jobs['orders'] = OrderWatcher().poll_once
+        enable_background_refresh()
+        run_scheduler(jobs, JOB_INTERVALS)
+        print("daemon stopped")
+    return True
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
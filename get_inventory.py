@@ -1,41 +1,95 @@
-from utils.ftp_utils import connect_ftp, upload_files
+from utils.ftp_utils import connect_ftp, upload_files, upload_is_current, file_sha256
 from utils.auth_utils import *
+from utils.api_client import api_get
+from utils.snapshot_utils import InventorySnapshot
+from utils.inventory_outputs import JsonlOutput, ParquetOutput, SqliteIndexOutput, IndexQuantityOutput
+from utils.metrics import metrics
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 import requests
+import argparse
+import tempfile
+import pickle
+import time
 import sys
 import csv
 import os
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 OUTPUT_CSV = os.path.join(BASE_DIR, "inventory.csv")
+DELTA_CSV = os.path.join(BASE_DIR, "inventory_delta.csv")
+JSONL_OUTPUT = os.path.join(BASE_DIR, "inventory.jsonl.gz")
+PARQUET_OUTPUT = os.path.join(BASE_DIR, "inventory.parquet")
+INDEX_OUTPUT = os.path.join(BASE_DIR, "inventory_index.db")
+
+# extra formats written next to the CSV: any of jsonl, parquet, index
+INVENTORY_OUTPUTS = [f.strip() for f in os.getenv('INVENTORY_OUTPUTS', 'index').split(',') if f.strip()]
 PAGE_SIZE = 500
 
-def get_inventory_page(token, page_no=0, page_size=PAGE_SIZE):
+# number of pages fetched in parallel; set to 1 to fall back to the serial crawl
+INVENTORY_CONCURRENCY = int(os.getenv('INVENTORY_CONCURRENCY', '4'))
+PAGE_RETRIES = 3
+PAGE_RETRY_BACKOFF = 2  # seconds, doubled after each failed attempt
+
+FULL_SELECT = "itemcode,sku,name,color,upc,size,sizeNum,ModelCode,GroupCode,active,description,brand,url,images,inventory,prices"
+# quantity-only refreshes skip the heavy description and images payloads
+QUANTITY_SELECT = "itemcode,sku,inventory,prices"
+QUANTITY_FIELDS = ["itemcode", "sku", "inventory"]
+QUANTITY_CSV = os.path.join(BASE_DIR, "inventory_quantities.csv")
+# quantity refreshes only update the local index unless the partner has asked for the file too
+UPLOAD_QUANTITIES = os.getenv('INVENTORY_UPLOAD_QUANTITIES', '').lower() in ('1', 'true', 'yes')
+
+# filter: active = true and inventory >= 0
+DEFAULT_FILTER = "(active,eq,true)and(inventory,ge,0)"
+
+def build_filter(brand=None, group=None):
     """
-    Retrieve a single page of inventory items.
-    Only items that are active are returned.
+    Narrow the default active-item filter to one brand and/or GroupCode.
+    """
+    item_filter = DEFAULT_FILTER
+    if brand:
+        item_filter += f"and(brand,eq,{brand})"
+    if group:
+        item_filter += f"and(GroupCode,eq,{group})"
+    return item_filter
+
+def request_inventory_page(token, page_no=0, page_size=PAGE_SIZE, query=None):
+    """
+    Request a single page of inventory items, raising requests.RequestException on failure.
+    Only items that are active are returned. `query` overrides the default select/filter params.
     """
-    items_url = f"{API_BASE_URL}/item"
-    
     headers = {
         "Authorization": f"Bearer {token}"
     }
     
-    # filter: active = true and inventory >= 0
     params = {
-        "select": "itemcode,sku,name,color,upc,size,sizeNum,ModelCode,GroupCode,active,description,brand,url,images,inventory,prices",
+        "select": FULL_SELECT,
         "page_no": page_no,
         "page_size": page_size,
-        "filter": "(active,eq,true)and(inventory,ge,0)"
+        "filter": DEFAULT_FILTER
     }
+    params.update(query or {})
     
-    try:
-        response = requests.get(items_url, headers=headers, params=params)
-        response.raise_for_status()
-    except requests.RequestException as err:
-        sys.exit(f"Failed to retrieve inventory page {page_no}: {err}")
-    
+    response = api_get("/item", headers=headers, params=params)
+    response.raise_for_status()
     return response.json()
 
+def get_inventory_page(token, page_no=0, page_size=PAGE_SIZE, retries=PAGE_RETRIES, query=None):
+    """
+    Retrieve a single page of inventory items, retrying with backoff.
+    Exits the script if the page still can't be fetched after all retries.
+    """
+    delay = PAGE_RETRY_BACKOFF
+    for attempt in range(1, retries + 1):
+        try:
+            return request_inventory_page(token, page_no, page_size, query)
+        except requests.RequestException as err:
+            if attempt == retries:
+                sys.exit(f"Failed to retrieve inventory page {page_no}: {err}")
+            print(f"Page {page_no} failed (attempt {attempt}/{retries}): {err}; retrying in {delay}s")
+            time.sleep(delay)
+            delay *= 2
+
 def parse_prices(prices):
     """
     Convert a list of price objects into a dictionary.
@@ -61,6 +115,173 @@ def get_large_images(images_obj):
             return urls
     return []
 
+BASE_FIELDS = [
+    "itemcode", "sku", "name", "color", "upc", "size", "sizeNum",
+    "ModelCode", "GroupCode", "active", "description", "brand", "url", "inventory"
+]
+
+def normalize_page(items, base_fields=BASE_FIELDS):
+    """
+    Normalize a page of raw items column by column in one pass.
+    Returns (base_columns, price_dicts, image_lists): one list per base field holding
+    that field for every item, plus the parsed prices and large images of every item.
+    """
+    base_columns = [[item.get(key, "") for item in items] for key in base_fields]
+    price_dicts = [parse_prices(item.get("prices", [])) for item in items]
+    image_lists = [get_large_images(item.get("images", {})) for item in items]
+    return base_columns, price_dicts, image_lists
+
+def page_rows(base_columns, price_dicts, image_lists, price_columns, max_image_count):
+    """
+    Assemble positional CSV rows for a normalized page, building each price and image
+    column in a single comprehension and zipping the columns together.
+    """
+    price_value_columns = [[prices.get(price_key, "") for prices in price_dicts] for price_key in price_columns]
+    image_columns = [
+        [images[i] if i < len(images) else "" for images in image_lists]
+        for i in range(max_image_count)
+    ]
+    return zip(*base_columns, *price_value_columns, *image_columns)
+
+def export_inventory_stream(pages, filename, snapshot=None, delta_filename=None, outputs=(), base_fields=BASE_FIELDS):
+    """
+    Streams pages of raw items to CSV without holding the catalog in memory.
+    The price-key and image columns are only known once every item has been seen, so each
+    page is normalized into columns and pickled to a temporary spill file while the column
+    schema is collected, then replayed into the final CSV page by page. The CSV is written to
+    a temp name and moved into place, so it is never left half-written. Returns the number
+    of items written.
+
+    When a snapshot is given, every row is diffed against it and added, changed and removed
+    rows are also written to `delta_filename` with a leading "change" column. The snapshot
+    is only committed once both files are on disk.
+
+    `outputs` are extra sinks (see utils.inventory_outputs) that receive the same rows as the
+    CSV, in the same column order. `base_fields` are the leading columns (BASE_FIELDS for the
+    full export, QUANTITY_FIELDS for a quantity-only refresh).
+    """
+    all_price_keys = set()
+    max_image_count = 0
+    item_count = 0
+
+    with tempfile.TemporaryFile(dir=os.path.dirname(filename) or None) as spill:
+        for items in pages:
+            if not items:
+                continue
+            with metrics.timer('csv', 'inventory_normalize') as sample:
+                sample['items'] = len(items)
+                base_columns, price_dicts, image_lists = normalize_page(items, base_fields)
+            for prices in price_dicts:
+                all_price_keys.update(prices)
+            max_image_count = max(max_image_count, max(map(len, image_lists)))
+            changes = None
+            if snapshot is not None:
+                changes = [
+                    snapshot.compare(snapshot_key(base_values), [list(base_values), prices, images])
+                    for base_values, prices, images in zip(zip(*base_columns), price_dicts, image_lists)
+                ]
+            pickle.dump((base_columns, price_dicts, image_lists, changes), spill, pickle.HIGHEST_PROTOCOL)
+            item_count += len(items)
+
+        if not item_count:
+            if snapshot is not None:
+                snapshot.rollback()
+            return 0
+
+        # sorted list of unique price keys for consistent ordering
+        price_columns = sorted(all_price_keys)
+
+        #csv headers
+        fieldnames = list(base_fields)
+        fieldnames.extend(price_columns)
+        for i in range(max_image_count):
+            fieldnames.append(f"image{i+1}")
+
+        # removed rows may have price keys or images no current item has; those columns only
+        # go in the delta file, so the CSV and the other outputs keep the catalog's layout
+        removed_rows = []
+        delta_price_keys = set(all_price_keys)
+        delta_image_count = max_image_count
+        if snapshot is not None:
+            for _, (base_values, prices, images) in snapshot.iter_removed():
+                delta_price_keys.update(prices)
+                delta_image_count = max(delta_image_count, len(images))
+                removed_rows.append((base_values, prices, images))
+        delta_price_columns = sorted(delta_price_keys)
+        delta_layout_differs = delta_price_columns != price_columns or delta_image_count != max_image_count
+        delta_fieldnames = list(base_fields) + delta_price_columns + [f"image{i+1}" for i in range(delta_image_count)]
+
+        tmp_filename = f"{filename}.tmp"
+        spill.seek(0)
+        tmp_delta_filename = f"{delta_filename}.tmp" if snapshot is not None and delta_filename else None
+        opened_outputs = []
+        try:
+            with metrics.timer('csv', 'inventory_write') as sample, ExitStack() as stack:
+                sample['items'] = item_count
+                csvfile = stack.enter_context(open(tmp_filename, mode="w", newline="", encoding="utf-8"))
+                writer = csv.writer(csvfile)
+                writer.writerow(fieldnames)
+                delta_writer = None
+                if tmp_delta_filename:
+                    deltafile = stack.enter_context(open(tmp_delta_filename, mode="w", newline="", encoding="utf-8"))
+                    delta_writer = csv.writer(deltafile)
+                    delta_writer.writerow(["change"] + delta_fieldnames)
+                for output in outputs:
+                    output.open(fieldnames)
+                    opened_outputs.append(output)
+
+                while True:
+                    try:
+                        base_columns, price_dicts, image_lists, changes = pickle.load(spill)
+                    except EOFError:
+                        break
+                    rows = page_rows(base_columns, price_dicts, image_lists, price_columns, max_image_count)
+                    if not delta_writer and not outputs:
+                        writer.writerows(rows)
+                        continue
+                    rows = list(rows)
+                    writer.writerows(rows)
+                    for output in outputs:
+                        output.write_rows(rows)
+                    if delta_writer:
+                        delta_rows = rows
+                        if delta_layout_differs:
+                            delta_rows = page_rows(base_columns, price_dicts, image_lists, delta_price_columns, delta_image_count)
+                        delta_writer.writerows((change,) + row for change, row in zip(changes, delta_rows) if change)
+
+                if delta_writer and removed_rows:
+                    base_values, price_dicts, image_lists = zip(*removed_rows)
+                    base_columns = [list(column) for column in zip(*base_values)]
+                    rows = page_rows(base_columns, price_dicts, image_lists, delta_price_columns, delta_image_count)
+                    delta_writer.writerows(("removed",) + row for row in rows)
+                csvfile.flush()
+                sample['bytes'] = os.path.getsize(tmp_filename)
+
+            while opened_outputs:
+                opened_outputs.pop(0).close()
+            os.replace(tmp_filename, filename)
+            if tmp_delta_filename:
+                os.replace(tmp_delta_filename, delta_filename)
+        except IOError as err:
+            if snapshot is not None:
+                snapshot.rollback()
+            sys.exit(f"Error writing CSV file: {err}")
+        finally:
+            for output in opened_outputs:
+                output.abort()
+
+    if snapshot is not None:
+        snapshot.commit()
+
+    return item_count
+
+def snapshot_key(base_values):
+    """
+    Snapshot key for a normalized row: the itemcode, falling back to the sku.
+    """
+    itemcode = base_values[BASE_FIELDS.index("itemcode")]
+    return str(itemcode or base_values[BASE_FIELDS.index("sku")])
+
 def export_inventory_to_csv(items, filename):
     """
     Exports the list of items to CSV.
@@ -69,120 +290,187 @@ def export_inventory_to_csv(items, filename):
       - One column per unique price key found across all items.
       - One column per large image (image1, image2, …) based on the maximum number of large images.
     """
-    processed_items = []
-    all_price_keys = set()
-    max_image_count = 0
+    return export_inventory_stream([items], filename)
 
-    for item in items:
-        price_dict = parse_prices(item.get("prices", []))
-        all_price_keys.update(price_dict.keys())
-        
-        # get large imgs
-        large_images = get_large_images(item.get("images", {}))
-        if len(large_images) > max_image_count:
-            max_image_count = len(large_images)
-        
-        processed_items.append({
-            "itemcode": item.get("itemcode", ""),
-            "sku": item.get("sku", ""),
-            "name": item.get("name", ""),
-            "color": item.get("color", ""),
-            "upc": item.get("upc", ""),
-            "size": item.get("size", ""),
-            "sizeNum": item.get("sizeNum", ""),
-            "ModelCode": item.get("ModelCode", ""),
-            "GroupCode": item.get("GroupCode", ""),
-            "active": item.get("active", ""),
-            "description": item.get("description", ""),
-            "brand": item.get("brand", ""),
-            "url": item.get("url", ""),
-            "inventory": item.get("inventory", ""),
-            "prices": price_dict,
-            "large_images": large_images
-        })
-
-    # sorted list of unique price keys for consistent ordering
-    price_columns = sorted(all_price_keys)
-    
-    #csv headers
-    fieldnames = [
-        "itemcode", "sku", "name", "color", "upc", "size", "sizeNum",
-        "ModelCode", "GroupCode", "active", "description", "brand", "url", "inventory"
-    ]
-    fieldnames.extend(price_columns)
-    for i in range(max_image_count):
-        fieldnames.append(f"image{i+1}")
+def page_items(response):
+    return response.get("_embedded", {}).get("items", [])
 
-    try:
-        with open(filename, mode="w", newline="", encoding="utf-8") as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            for processed_item in processed_items:
-                row = {}
-                # fields
-                for key in ["itemcode", "sku", "name", "color", "upc", "size", "sizeNum",
-                            "ModelCode", "GroupCode", "active", "description", "brand", "url", "inventory"]:
-                    row[key] = processed_item.get(key, "")
-                # prices
-                for price_key in price_columns:
-                    row[price_key] = processed_item["prices"].get(price_key, "")
-                # images
-                large_images = processed_item["large_images"]
-                for i in range(max_image_count):
-                    col_name = f"image{i+1}"
-                    row[col_name] = large_images[i] if i < len(large_images) else ""
-                writer.writerow(row)
-    except IOError as err:
-        sys.exit(f"Error writing CSV file: {err}")
-
-def fetch_all_inventory(token):
-    """
-    Iterate through all pages to fetch every available inventory item that matches the filter.
-    """
-    all_items = []
+def iter_inventory_pages_serial(token, query=None):
+    """
+    Iterate through all pages, yielding the items of each page that matches the filter.
+    """
     page_no = 0
 
     while True:
         print(f"Fetching page {page_no}...")
-        response = get_inventory_page(token, page_no)
-        items = response.get("_embedded", {}).get("items", [])
+        response = get_inventory_page(token, page_no, query=query)
+        items = page_items(response)
         if not items:
             break
-        all_items.extend(items)
+        yield items
         if len(items) < PAGE_SIZE:
             break
         page_no += 1
 
-    return all_items
+def iter_inventory_pages_concurrent(token, concurrency=INVENTORY_CONCURRENCY, query=None):
+    """
+    Yield every inventory page using a bounded thread pool.
+    Up to `concurrency` pages are requested ahead of the one being consumed. Pages are
+    yielded strictly in order, and the crawl stops at the first empty or short page;
+    any pages requested past that point are discarded.
+    """
+    in_flight = {}
+    next_page = 0
+    page_no = 0
 
-def get_inventory():
-    print("Authenticating with the API...")
-    token = get_jwt()
-    
-    print("Fetching all inventory pages for active items with inventory >= 0 units")
-    all_items = fetch_all_inventory(token)
-    
-    if not all_items:
-        print("No items found in the API response.")
-        return
-    
-    print(f"Total items fetched: {len(all_items)}")
-    
-    export_inventory_to_csv(all_items, OUTPUT_CSV)
-    print(f"Inventory data exported successfully to '{OUTPUT_CSV}'.")
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        try:
+            while True:
+                # keep the pool saturated with pages ahead of the one being consumed
+                while len(in_flight) < concurrency:
+                    print(f"Fetching page {next_page}...")
+                    in_flight[next_page] = executor.submit(metrics.propagate(get_inventory_page), token, next_page, query=query)
+                    next_page += 1
+
+                response = in_flight.pop(page_no).result()
+                items = page_items(response)
+                if items:
+                    yield items
+                if len(items) < PAGE_SIZE:
+                    break
+                page_no += 1
+        finally:
+            for future in in_flight.values():
+                future.cancel()
+
+def iter_inventory_pages(token, concurrency=INVENTORY_CONCURRENCY, query=None):
+    """
+    Yield inventory pages, concurrently unless concurrency is 1 or less.
+    """
+    if concurrency <= 1:
+        return iter_inventory_pages_serial(token, query)
+    return iter_inventory_pages_concurrent(token, concurrency, query)
+
+def fetch_all_inventory_serial(token):
+    return [item for items in iter_inventory_pages_serial(token) for item in items]
+
+def fetch_all_inventory_concurrent(token, concurrency=INVENTORY_CONCURRENCY):
+    return [item for items in iter_inventory_pages_concurrent(token, concurrency) for item in items]
+
+def fetch_all_inventory(token, concurrency=INVENTORY_CONCURRENCY):
+    """
+    Fetch every inventory item into a list, concurrently unless concurrency is 1 or less.
+    """
+    return [item for items in iter_inventory_pages(token, concurrency) for item in items]
+
+def build_outputs(formats=INVENTORY_OUTPUTS):
+    outputs = []
+    for name in formats:
+        if name == "jsonl":
+            outputs.append(JsonlOutput(JSONL_OUTPUT))
+        elif name == "parquet":
+            if ParquetOutput.available():
+                outputs.append(ParquetOutput(PARQUET_OUTPUT))
+            else:
+                print("pyarrow is not installed, skipping the parquet output")
+        elif name == "index":
+            outputs.append(SqliteIndexOutput(INDEX_OUTPUT))
+        else:
+            print(f"Unknown inventory output format: {name}")
+    return outputs
+
+def targeted_filename(filename, brand=None, group=None):
+    """
+    Output name for a brand/group-filtered run, e.g. inventory_brand-Wilson.csv.
+    """
+    root, ext = os.path.splitext(filename)
+    if brand:
+        root += f"_brand-{brand}"
+    if group:
+        root += f"_group-{group}"
+    return root + ext
+
+def upload_inventory_file(local_path):
+    # skip connecting at all when the file on the FTP is already identical
+    remote_filename = os.path.basename(local_path)
+    content_hash = file_sha256(local_path)
+    if upload_is_current(remote_filename, content_hash):
+        print(f"{remote_filename} unchanged since last upload, skipping FTP upload.")
+        return True
 
     ftp = connect_ftp()
     if ftp:
         try:
-            remote_filename = os.path.basename(OUTPUT_CSV)
-            upload_files(ftp, OUTPUT_CSV, remote_filename)
+            upload_files(ftp, local_path, remote_filename, content_hash)
         finally:
             ftp.quit()
             print('ftp connection closed')
     else:
         print('could not connect to ftp')
-        return
+        return False
+    return True
+
+def get_inventory(quantity_only=False, brand=None, group=None, upload_quantities=UPLOAD_QUANTITIES):
+    """
+    Export the inventory and upload it to the FTP.
+    The default full export covers every field of the whole active catalog and is diffed
+    against the snapshot. quantity_only fetches just itemcode, sku, inventory and prices into
+    inventory_quantities.csv and refreshes the lookup index in place; that file is only
+    uploaded with upload_quantities (INVENTORY_UPLOAD_QUANTITIES). A brand or group filter
+    only covers part of the catalog, so filtered runs write to their own file and are neither
+    diffed nor uploaded.
+    """
+    print("Authenticating with the API...")
+    token = get_jwt()
+
+    query = {"filter": build_filter(brand, group)}
+    targeted = bool(brand or group)
+    snapshot = None
+    if quantity_only:
+        query["select"] = QUANTITY_SELECT
+        filename = targeted_filename(QUANTITY_CSV, brand, group)
+        export_args = {"outputs": [IndexQuantityOutput(INDEX_OUTPUT)], "base_fields": QUANTITY_FIELDS}
+    elif targeted:
+        filename = targeted_filename(OUTPUT_CSV, brand, group)
+        export_args = {}
+    else:
+        filename = OUTPUT_CSV
+        snapshot = InventorySnapshot()
+        export_args = {"snapshot": snapshot, "delta_filename": DELTA_CSV, "outputs": build_outputs()}
+
+    print(f"Fetching inventory pages ({query['select'] if quantity_only else 'all fields'}; filter {query['filter']})")
+    try:
+        with metrics.stage('inventory.fetch_export'):
+            item_count = export_inventory_stream(iter_inventory_pages(token, query=query), filename, **export_args)
+
+        if not item_count:
+            print("No items found in the API response.")
+            return False
+
+        print(f"Total items fetched: {item_count}")
+        print(f"Inventory data exported successfully to '{filename}'.")
+        if snapshot is not None:
+            print(f"Inventory changes since last run ({snapshot.summary()}) written to '{DELTA_CSV}'.")
+    finally:
+        if snapshot is not None:
+            snapshot.close()
+
+    if targeted or (quantity_only and not upload_quantities):
+        return True
+    with metrics.stage('inventory.upload'):
+        return upload_inventory_file(filename)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export the Fromuth inventory to CSV and upload it to the FTP.")
+    parser.add_argument('--quantity-only', action='store_true',
+                        help="only fetch itemcode, sku, inventory and prices (fast stock refresh)")
+    parser.add_argument('--upload-quantities', action='store_true', default=UPLOAD_QUANTITIES,
+                        help="also upload the --quantity-only file to the FTP (default: INVENTORY_UPLOAD_QUANTITIES)")
+    parser.add_argument('--brand', help="only export items of this brand (not uploaded)")
+    parser.add_argument('--group', help="only export items with this GroupCode (not uploaded)")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    get_inventory_success = get_inventory()
-    sys.exit(0 if get_inventory_success else 1)
\ No newline at end of file
+    args = parse_args()
+    get_inventory_success = get_inventory(args.quantity_only, args.brand, args.group, args.upload_quantities)
+    sys.exit(0 if get_inventory_success else 1)
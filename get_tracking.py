@@ -1,96 +1,214 @@
+import os
 import json
-import requests
-from utils.auth_utils import get_jwt, API_BASE_URL
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.auth_utils import get_jwt
+from utils.api_client import api_get
 from utils.gsheet_utils import setup_google_sheets
+from utils.tracking_cache import TrackingCache, NOT_FOUND
+from utils.metrics import metrics
 from dotenv import load_dotenv
 import sys
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# number of tracking lookups in flight at once
+TRACKING_CONCURRENCY = int(os.getenv('TRACKING_CONCURRENCY', '8'))
+# seconds between full reads of the sheet, which catch rows edited above the cursor
+FULL_SCAN_INTERVAL = int(os.getenv('TRACKING_FULL_SCAN_INTERVAL', '86400'))
+
 def get_order_by_customer_order_number(customer_order_number, headers):
-    url = f"{API_BASE_URL}/order/{customer_order_number}"
     params = {
         "by": "customer_order_number",
         "select": "order_number,customer_order_number,ec_order_number,state,tracking_numbers,order_notes,documents"
     }
-    response = requests.get(url, headers=headers, params=params)
+    response = api_get(f"/order/{customer_order_number}", headers=headers, params=params)
     response.raise_for_status()
     return response.json()
 
-def update_sheet_with_tracking(sheet, headers):
-    rows = sheet.get_all_values()  # get all rows from the sheet
-    updated_data = []  # store updated values for batch write to gsheets later
+def extract_tracking(customer_order_number, order, carrier):
+    """
+    Work out (carrier, tracking_number) for an order returned by the API.
+    Cancelled orders get CANCELLED in both columns.
+    """
+    order_state = order.get("state", "")
+    if order_state.upper() == "CANCELLED":
+        logger.debug(f"Order {customer_order_number} is cancelled. Setting carrier and tracking to 'cancelled'")
+        return "CANCELLED", "CANCELLED"
+
+    # For non-cancelled orders, process tracking numbers
+    tracking_numbers = order.get("tracking_numbers", [])
+    # Check documents for tracking info if none exist
+    if not tracking_numbers:
+        for doc in order.get("documents", []):
+            tracking = doc.get("tracking")
+            if tracking:
+                tracking_numbers.append(tracking)
+    logger.debug(f"Extracted tracking_numbers: {tracking_numbers}")
+
+    # Get the shipping method name from documents if not already set
+    if not carrier:
+        for doc in order.get("documents", []):
+            method = doc.get("shipping_method_name")
+            if method:
+                carrier = method
+                break
+
+    # Take the first tracking number if available
+    if tracking_numbers:
+        tracking_number = tracking_numbers[0]
+    else:
+        tracking_number = ""
+        logger.debug(f"No tracking number found for order: {customer_order_number}")
+
+    # Log order notes for debugging
+    logger.debug(f"Order notes: {order.get('order_notes', '')}")
+    return carrier, tracking_number
+
+def lookup_tracking(customer_order_number, carrier, tracking_number, headers):
+    """
+    Look up one order and return its (carrier, tracking_number, state), falling back to the
+    current carrier/tracking if the order can't be found or the lookup fails.
+    state is NOT_FOUND for unknown orders and None when the lookup failed.
+    """
+    state = None
+    logger.debug(f"Finding tracking for order number: {customer_order_number}")
+    try:
+        # Get order details using the customer order number
+        order_response = get_order_by_customer_order_number(customer_order_number, headers)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Full API response:\n{json.dumps(order_response, indent=4)}")
+
+        order = order_response.get('_embedded', {}).get('order')
+        if order:
+            state = order.get("state", "")
+            carrier, tracking_number = extract_tracking(customer_order_number, order, carrier)
+            logger.debug(f"Order {customer_order_number}: Carrier: {carrier}, Tracking Number: {tracking_number}")
+        else:
+            state = NOT_FOUND
+            print(f"Order not found for customer order number: {customer_order_number}")
+    except Exception as e:
+        print(f"Error processing order {customer_order_number}: {str(e)}")
+    return carrier, tracking_number, state
 
-    # Loop over each data row (skip header, starting at row 2)
-    for i, row in enumerate(rows[1:], start=2):
+def read_open_rows(sheet, cache):
+    """
+    Read columns A:D from the cursor row (the first untracked row, or the last order when all
+    were tracked) down.
+    Returns (start_row, rows, full_scan). The cursor saved in the cache is used unless a full
+    scan from row 2 is due, or the row it points at no longer holds the PO it was saved with.
+    """
+    cursor = cache.sheet_cursor() if cache is not None else None
+    full_scan = cursor is None or time.time() - cursor['full_scan_at'] > FULL_SCAN_INTERVAL
+    start_row = 2 if full_scan else cursor['row']
+    rows = sheet.get(f"A{start_row}:D")
+    if not full_scan and cursor['anchor']:
+        first_po = rows[0][0].strip() if rows and rows[0] else ""
+        if first_po != cursor['anchor']:
+            print(f"Row {start_row} no longer holds order {cursor['anchor']}; rescanning the sheet from row 2")
+            start_row, full_scan = 2, True
+            rows = sheet.get("A2:D")
+    return start_row, rows, full_scan
+
+def update_sheet_with_tracking(sheet, headers, concurrency=TRACKING_CONCURRENCY, cache=None):
+    """
+    Fill in carrier and tracking for the orders in the sheet that don't have tracking yet.
+    With a cache, only the rows from the first untracked one down are read, and only rows
+    that changed are written back, so Sheets traffic grows with the open orders rather than
+    the whole history.
+    """
+    with metrics.stage('tracking.read_sheet'):
+        start_row, rows, full_scan = read_open_rows(sheet, cache)
+    print(f"Read {len(rows)} rows from row {start_row}{' (full scan)' if full_scan else ''}")
+    updated_data = []  # current [carrier, tracking] of every row read
+    pending = {}  # index into updated_data -> customer order number still missing tracking
+    skipped = 0
+
+    # rows[0] is sheet row start_row
+    for row in rows:
         customer_order_number = row[0].strip() if len(row) > 0 else ""  # col A: customer order number
         carrier = row[2].strip() if len(row) > 2 else ""                # col C: carrier (shipping method)
         tracking_number = row[3].strip() if len(row) > 3 else ""          # col D: tracking number
 
         if customer_order_number and not tracking_number:
-            print(f"\nFinding tracking for order number: {customer_order_number}")
-            try:
-                # Get order details using the customer order number
-                order_response = get_order_by_customer_order_number(customer_order_number, headers)
-                print("Full API response:")
-                print(json.dumps(order_response, indent=4))
-                
-                order = order_response.get('_embedded', {}).get('order')
-                if order:
-                    order_state = order.get("state", "")
-                    if order_state.upper() == "CANCELLED":
-                        carrier = "CANCELLED"
-                        tracking_number = "CANCELLED"
-                        print(f"Order {customer_order_number} is cancelled. Setting carrier and tracking to 'cancelled'")
-                    else:
-                        # For non-cancelled orders, process tracking numbers
-                        tracking_numbers = order.get("tracking_numbers", [])
-                        # Check documents for tracking info if none exist
-                        if not tracking_numbers:
-                            for doc in order.get("documents", []):
-                                tracking = doc.get("tracking")
-                                if tracking:
-                                    tracking_numbers.append(tracking)
-                        print("Extracted tracking_numbers:", tracking_numbers)
-                        
-                        # Get the shipping method name from documents if not already set
-                        if not carrier:
-                            for doc in order.get("documents", []):
-                                method = doc.get("shipping_method_name")
-                                if method:
-                                    carrier = method
-                                    break
-                        
-                        # Take the first tracking number if available
-                        if tracking_numbers:
-                            tracking_number = tracking_numbers[0]
-                        else:
-                            tracking_number = ""
-                            print(f"No tracking number found for order: {customer_order_number}")
-                        
-                        # Print order notes for debugging
-                        order_notes = order.get("order_notes", "")
-                        print("Order notes:", order_notes)
-                    
-                    print(f"Updated row {i}: Carrier: {carrier}, Tracking Number: {tracking_number}")
-                else:
-                    print(f"Order not found for customer order number: {customer_order_number}")
-            except Exception as e:
-                print(f"Error processing order {customer_order_number}: {str(e)}")
-
+            # skip orders whose last known state is still within its TTL
+            if cache is not None and cache.is_fresh(customer_order_number):
+                skipped += 1
+            else:
+                pending[len(updated_data)] = customer_order_number
         updated_data.append([carrier, tracking_number])
-    
-    end_row = len(rows)
-    range_str = f"C2:D{end_row}"
-    print(f"\nPerforming batch update to range {range_str} with {len(updated_data)} rows.")
-    sheet.update(range_str, updated_data)
-    print("Batch update complete!")
-
-def get_tracking():
+    original_data = [list(values) for values in updated_data]
+
+    # look up the untracked orders through a bounded pool; results are written back by position
+    print(f"Looking up tracking for {len(pending)} orders with {concurrency} workers "
+          f"({skipped} skipped with a fresh cached state)")
+    start = time.perf_counter()
+    with metrics.stage('tracking.lookup'), ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(metrics.propagate(lookup_tracking), customer_order_number, *updated_data[index], headers): index
+            for index, customer_order_number in pending.items()
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            carrier, tracking_number, state = future.result()
+            updated_data[index] = [carrier, tracking_number]
+            if cache is None:
+                continue
+            if tracking_number:
+                cache.forget(pending[index])
+            elif state is not None:
+                cache.record(pending[index], state)
+    elapsed = time.perf_counter() - start
+    if pending:
+        found = sum(1 for index in pending if updated_data[index][1])
+        print(f"Looked up {len(pending)} orders in {elapsed:.1f}s "
+              f"({len(pending) / elapsed:.1f} lookups/s); {found} now have tracking")
+
+    # write back only the rows whose carrier or tracking changed
+    changes = [
+        {'range': f"C{start_row + index}:D{start_row + index}", 'values': [updated_data[index]]}
+        for index in pending
+        if updated_data[index] != original_data[index]
+    ]
+    if changes:
+        print(f"\nUpdating carrier/tracking on {len(changes)} rows.")
+        with metrics.stage('tracking.write_sheet'):
+            sheet.batch_update(changes)
+        print("Batch update complete!")
+    else:
+        print("No tracking changes to write.")
+
+    if cache is not None:
+        # the next run starts at the first row still waiting for tracking or, when every row is
+        # tracked, at the last order read; either way the cursor is anchored on a PO, so rows
+        # deleted above it are noticed and trigger a rescan instead of skipping new orders
+        previous = cache.sheet_cursor()
+        order_rows = [index for index, row in enumerate(rows) if row and row[0].strip()]
+        open_rows = [index for index in order_rows if not updated_data[index][1]]
+        if open_rows or order_rows:
+            index = open_rows[0] if open_rows else order_rows[-1]
+            cursor_row, anchor = start_row + index, rows[index][0].strip()
+        elif previous is not None and not full_scan:
+            cursor_row, anchor = previous['row'], previous['anchor']
+        else:
+            cursor_row, anchor = 2, ""
+        full_scan_at = time.time() if full_scan else previous['full_scan_at']
+        cache.set_sheet_cursor(cursor_row, anchor, full_scan_at)
+        cache.commit()
+
+def get_tracking(sheet=None):
     token = get_jwt()
     headers = {'Authorization': f'Bearer {token}'}
-    sheet = setup_google_sheets()
-    update_sheet_with_tracking(sheet, headers)
+    sheet = sheet or setup_google_sheets()
+    cache = TrackingCache()
+    try:
+        update_sheet_with_tracking(sheet, headers, cache=cache)
+    finally:
+        cache.close()
+    return True
 
 if __name__ == '__main__':
     get_tracking_success = get_tracking()
@@ -1,78 +1,100 @@
 from utils.ftp_utils import *
 from utils.auth_utils import *
-from utils.email_utils import send_email
+from utils.gsheet_utils import get_sheet_session
 from post_orders import *
 from get_tracking import get_tracking
 from get_inventory import get_inventory
+from utils.job_utils import run_jobs, run_job, JobResult
+from utils.metrics import metrics, REPORT_DIR
+from utils.email_utils import flush_emails
 from dotenv import load_dotenv
+import argparse
+import cProfile
+import pstats
+import sys
 import os
 
 load_dotenv()
 
-def main():
-    # setup local archive directory
-    archive_dir = os.path.join(LOCAL_ORDERS_DIR, 'processed')
-    os.makedirs(archive_dir, exist_ok=True)
-
-    # download files from FTP
-    ftp = connect_ftp()
-    downloaded_files = []
-    if ftp:
-        try:
-            downloaded_files = download_files(ftp)
-        finally:
-            if downloaded_files:
-                archive_files_on_ftp(ftp, downloaded_files)
-            ftp.quit()
-            print("FTP connection closed")
-    else:
+def main(sheet=None):
+    # download files from FTP, archiving each one there as soon as it is on disk
+    with metrics.stage('orders.download'):
+        downloaded_files = download_order_files()
+    if downloaded_files is None:
         print("Could not connect to FTP")
-        return
+        return False
 
     if not downloaded_files:
         print("No files to download")
-        return
-
-    # authenticate with API
-    try:
-        token = get_jwt()
-    except APIError as e:
-        error_message = f"Failed to authenticate with API: {str(e)}"
-        print(error_message)
-        send_email("Fromuth Authentication Error", error_message)
-        return
+        return True
 
-    headers = {'Authorization': f'Bearer {token}'}
+    # google is only contacted once there are orders to record
+    return process_order_files(downloaded_files, sheet or get_sheet_session().sheet)
 
-    successful_orders = []
-    failed_orders = []
+# seconds each job may run before it is reported as timed out
+JOB_TIMEOUTS = {
+    'orders': int(os.getenv('ORDERS_TIMEOUT', '900')),
+    'tracking': int(os.getenv('TRACKING_TIMEOUT', '1800')),
+    'inventory': int(os.getenv('INVENTORY_TIMEOUT', '2700')),
+    'stock': int(os.getenv('STOCK_TIMEOUT', '900')),
+}
+DEFAULT_JOBS = ['orders', 'tracking', 'inventory']
 
-    # process downloaded order files & place the orders
-    for file in downloaded_files:
-        try:
-            process_order_file(file, headers, archive_dir, successful_orders, failed_orders)
-        except Exception as e:
-            error_message = f"Error processing file {file}: {str(e)}"
-            print(error_message)
-            send_email("Fromuth Order File Failed", error_message)
+def build_jobs(names):
+    # the sheet session is opened lazily inside the jobs so a google failure only fails those jobs
+    jobs = {
+        'orders': main,
+        'tracking': lambda: get_tracking(get_sheet_session().sheet),
+        'inventory': get_inventory,
+        'stock': lambda: get_inventory(quantity_only=True),
+    }
+    return {name: jobs[name] for name in names}
 
-    # send summary email
-    print('sending summary email')
-    subject = "Fromuth Order Summary"
-    successful_msg = ', '.join(f'{po_num} ({f})' for f, po_num in successful_orders) if successful_orders else "None"
-    failed_msg = ', '.join(f'{po_num} ({f})' for f, po_num, _ in failed_orders) if failed_orders else "None"
-    # failed_msg = ', '.join(f'{po_num} ({f}): {e}' for f, po_num, e in failed_orders) if failed_orders else "None"
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the Fromuth order, tracking and inventory workflows.")
+    parser.add_argument('--jobs', nargs='+', choices=list(JOB_TIMEOUTS), default=DEFAULT_JOBS,
+                        help="workflows to run concurrently (default: orders tracking inventory); "
+                             "stock is a quantity-only inventory refresh")
+    parser.add_argument('--profile', action='store_true',
+                        help="run a single job in the foreground under cProfile and save the stats to the "
+                             "reports directory (worker threads are not profiled; set the *_CONCURRENCY "
+                             "variables to 1 to see their work)")
+    args = parser.parse_args()
+    if args.profile and len(args.jobs) != 1:
+        parser.error("--profile needs exactly one job")
+    return args
 
-    body = f"""
-        Successful orders: {len(successful_orders)}
-        {successful_msg}
-
-        Failed orders: {len(failed_orders)}
-        {failed_msg}
-        """
-    send_email(subject, body)
+def profile_job(name, func):
+    """
+    Run one job on this thread under cProfile, print the top functions by cumulative time and
+    save the full stats next to the run's JSON report.
+    """
+    profiler = cProfile.Profile()
+    result = JobResult(name)
+    profiler.runcall(run_job, name, func, result)
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    stats_path = os.path.join(REPORT_DIR, f"run-{metrics.run_id}-{name}.prof")
+    profiler.dump_stats(stats_path)
+    pstats.Stats(profiler).sort_stats('cumulative').print_stats(30)
+    print(f"profile saved to {stats_path} (view with: python -m pstats {stats_path})")
+    return [result]
 
 if __name__ == '__main__':
-    main()
-    get_tracking()
-    get_inventory()
\ No newline at end of file
+    args = parse_args()
+    if args.profile:
+        results = profile_job(args.jobs[0], build_jobs(args.jobs)[args.jobs[0]])
+    else:
+        results = run_jobs(build_jobs(args.jobs), JOB_TIMEOUTS)
+    for result in results:
+        print(f"job {result}")
+    metrics.print_summary()
+    try:
+        print(f"performance report written to {metrics.write_report(jobs={r.name: r.status for r in results})}")
+    except OSError as e:
+        print(f"could not write the performance report: {e}")
+    # queued notifications and error digests go out before exiting
+    if not flush_emails():
+        print("timed out sending queued emails")
+    # exit straight away: a timed-out job's thread must not keep the process alive
+    sys.stdout.flush()
+    os._exit(0 if all(result.ok for result in results) else 1)
\ No newline at end of file
@@ -1,19 +1,32 @@
 from utils.ftp_utils import *
 from utils.auth_utils import *
-from utils.email_utils import send_email
-from utils.gsheet_utils import setup_google_sheets, add_po_num_fromuth_num_to_sheet
+from utils.email_utils import send_email, send_error_email
+from utils.api_client import api_get, api_post
+from utils.gsheet_utils import setup_google_sheets, SheetWriter
+from utils.order_ledger import OrderLedger, PLACED, SUBMITTING
+from utils.stock_check import StockCheck
+from utils.metrics import metrics
+from get_inventory import get_inventory, INDEX_OUTPUT
 from dotenv import load_dotenv
-import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import shutil
 import os
 import csv
 
 load_dotenv()
 
+# number of POs checked and placed in parallel
+ORDER_CONCURRENCY = int(os.getenv('ORDER_CONCURRENCY', '4'))
+
+# columns every order file must have; Ship To Address 2 is optional
+REQUIRED_COLUMNS = ['PO_num', 'First Name', 'Last Name', 'Ship To Address', 'Ship To City',
+                    'Ship To State', 'Ship To Zip', 'SKU', 'QTY']
+# columns the API can't place an order without; a blank name (e.g. a company order) is fine
+REQUIRED_VALUES = ['PO_num', 'Ship To Address', 'Ship To City', 'Ship To State', 'Ship To Zip', 'SKU', 'QTY']
+
 def get_order(po_num, headers):
-    url = f'{API_BASE_URL}/order/{po_num}'
     params = {'by': 'customer_order_number'}
-    response = requests.get(url, params=params, headers=headers)
+    response = api_get(f'/order/{po_num}', params=params, headers=headers)
     data = response.json()
     if response.ok:
         return data.get('_embedded', {}).get('order')
@@ -45,53 +58,248 @@ def place_order(po_num, order_data, headers):
             'quantity': item['quantity']
         })
 
-    url = f'{API_BASE_URL}/order'
-    response = requests.post(url, json=payload, headers=headers)
+    response = api_post('/order', json=payload, headers=headers)
     data = response.json()
     if response.ok:
         return data.get('data')
     else:
         raise APIError(data)
 
-def process_order_file(file, headers, archive_dir, successful_orders, failed_orders):
-    sheet = setup_google_sheets()
+def submit_po(file, po_num, order, headers, ledger):
+    """
+    Check-then-place a single PO. Runs on a worker thread, so it only talks to the API and
+    the ledger; the caller handles the sheet, summary lists and emails.
+    The ledger is consulted first; the API existence check only runs when the ledger can't
+    vouch for the PO being new.
+    Returns ('placed', order_response), ('skipped', reason) or ('failed', error message).
+    """
+    claimed, previous_status = ledger.claim(po_num, file)
+    if not claimed:
+        if previous_status == SUBMITTING:
+            return 'skipped', 'another worker or run is submitting it'
+        return 'skipped', f'ledger status is {previous_status}'
 
-    file_path = os.path.join(LOCAL_ORDERS_DIR, file)
-    with open(file_path, 'r') as f:
-        reader = csv.DictReader(f)
-        orders_data = list(reader)
+    try:
+        if ledger.needs_remote_check(previous_status):
+            existing_order = get_order(po_num, headers)
+            if existing_order:
+                ledger.mark_placed(po_num, existing_order.get('order_number'))
+                return 'skipped', 'already exists in Fromuth'
 
-    # group orders by PO number
+        order_response = place_order(po_num, order, headers)
+        ledger.mark_placed(po_num, order_response.get('order_number'))
+        return 'placed', order_response
+    except Exception as e:
+        ledger.mark_failed(po_num, str(e))
+        return 'failed', str(e)
+
+def open_ledger(sheet):
+    """
+    Open the order ledger, seeding it once from the PO / Fromuth order number columns of the
+    tracking sheet so orders placed before the ledger existed are known.
+    """
+    ledger = OrderLedger()
+    if not ledger.seeded:
+        rows = sheet.get_all_values()[1:]
+        mappings = [(row[0].strip(), row[1].strip() if len(row) > 1 else '') for row in rows if row and row[0].strip()]
+        ledger.seed(mappings)
+        print(f'Seeded order ledger with {len(mappings)} POs from the google sheet')
+    return ledger
+
+def validate_order_row(row):
+    """
+    Return why an order row can't be placed, or None if it is fine.
+    """
+    missing = [column for column in REQUIRED_VALUES if not (row.get(column) or '').strip()]
+    if missing:
+        return f"missing {', '.join(missing)}"
+    try:
+        quantity = int(row['QTY'].strip())
+    except ValueError:
+        return f"QTY {row['QTY']!r} is not a whole number"
+    if quantity <= 0:
+        return f"QTY {quantity} is not positive"
+    return None
+
+def parse_order_file(file_path, reject_path):
+    """
+    Validate and group an order CSV in one streaming pass.
+    Returns (grouped_orders, rejected_pos). grouped_orders maps PO number to its shipping info
+    and items, with repeated SKU lines merged into one item. Rows that fail validation are
+    written to `reject_path` with their line number and reason; rejected_pos counts them per
+    PO so the caller can hold those POs back rather than place them with lines missing.
+    Raises ValueError if the file lacks a required column.
+    """
     grouped_orders = {}
-    for row in orders_data:
-        po_num = row['PO_num']
-        if po_num not in grouped_orders:
-            grouped_orders[po_num] = {
-                'shipping_info': {
-                    'fname': row['First Name'],
-                    'lname': row['Last Name'],
-                    'address1': row['Ship To Address'],
-                    'address2': row.get('Ship To Address 2', ''),
-                    'city': row['Ship To City'],
-                    'state': row['Ship To State'],
-                    'zip': row['Ship To Zip']
-                },
-                'items': []
-            }
-        grouped_orders[po_num]['items'].append({
-            'sku': row['SKU'],
-            'quantity': int(row['QTY'])
-        })
+    rejected_pos = {}
+    reject_file = None
+    try:
+        with open(file_path, 'r', newline='') as f:
+            reader = csv.DictReader(f)
+            missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+            if missing:
+                raise ValueError(f"missing columns: {', '.join(missing)}")
+
+            for row in reader:
+                po_num = (row.get('PO_num') or '').strip()
+                error = validate_order_row(row)
+                if error:
+                    if reject_file is None:
+                        os.makedirs(os.path.dirname(reject_path), exist_ok=True)
+                        reject_file = open(reject_path, 'w', newline='')
+                        reject_writer = csv.DictWriter(reject_file, fieldnames=['line', 'error'] + reader.fieldnames,
+                                                       extrasaction='ignore')
+                        reject_writer.writeheader()
+                    reject_writer.writerow({**row, 'line': reader.line_num, 'error': error})
+                    rejected_pos[po_num] = rejected_pos.get(po_num, 0) + 1
+                    continue
+
+                order = grouped_orders.get(po_num)
+                if order is None:
+                    order = grouped_orders[po_num] = {
+                        'shipping_info': {
+                            'fname': row['First Name'],
+                            'lname': row['Last Name'],
+                            'address1': row['Ship To Address'],
+                            'address2': row.get('Ship To Address 2') or '',
+                            'city': row['Ship To City'],
+                            'state': row['Ship To State'],
+                            'zip': row['Ship To Zip']
+                        },
+                        'items': {}  # sku -> quantity while parsing
+                    }
+                sku = row['SKU'].strip()
+                order['items'][sku] = order['items'].get(sku, 0) + int(row['QTY'])
+    finally:
+        if reject_file is not None:
+            reject_file.close()
 
-    for po_num, order in grouped_orders.items():
+    for order in grouped_orders.values():
+        order['items'] = [{'sku': sku, 'quantity': quantity} for sku, quantity in order['items'].items()]
+    return grouped_orders, rejected_pos
+
+def open_stock_check():
+    """
+    Stock pre-flight check against the inventory index, refreshed with a quantity-only export when stale.
+    """
+    stock_check = StockCheck(INDEX_OUTPUT, refresh=lambda: get_inventory(quantity_only=True))
+    stock_check.ensure_fresh()
+    return stock_check
+
+def process_order_file(file, headers, archive_dir, successful_orders, failed_orders, sheet=None, ledger=None, seen_pos=None,
+                       stock_check=None):
+    sheet = sheet or setup_google_sheets()
+    sheet_writer = SheetWriter(sheet, po_num_col=1, fromuth_num_col=2)
+    own_ledger = ledger is None
+    ledger = ledger or open_ledger(sheet)
+    try:
+        place_orders_from_file(file, headers, archive_dir, successful_orders, failed_orders, sheet_writer, ledger, seen_pos,
+                               stock_check)
+    finally:
+        # one append for the whole file; the orders are placed either way, so a failed append
+        # is only reported, and its rows stay journaled for the next SheetWriter to write
         try:
-            existing_order = get_order(po_num, headers)
-            if existing_order:
-                print(f'Order {po_num} has already been placed.')
+            sheet_writer.flush()
+        except Exception as e:
+            error_message = f"Failed to add {len(sheet_writer.rows)} order numbers from {file} to the google sheet, will retry: {str(e)}"
+            print(error_message)
+            send_error_email("Fromuth Sheet Update Failed", error_message)
+        if own_ledger:
+            ledger.close()
+
+def place_orders_from_file(file, headers, archive_dir, successful_orders, failed_orders, sheet_writer, ledger, seen_pos=None,
+                           stock_check=None):
+    """
+    Place every PO in an order file. `seen_pos` (PO number -> (file, order)) is shared by the
+    files of one run, so a PO exported in more than one file is only placed once.
+    With a `stock_check`, lines with unknown SKUs or too little stock are flagged, or their
+    PO held back when the check is set to reject.
+    """
+    file_path = os.path.join(LOCAL_ORDERS_DIR, file)
+    reject_path = os.path.join(LOCAL_ORDERS_DIR, 'rejects', f'{os.path.splitext(file)[0]}.rejects.csv')
+    with metrics.timer('csv', 'order_parse') as sample:
+        grouped_orders, rejected_pos = parse_order_file(file_path, reject_path)
+        sample['bytes'] = os.path.getsize(file_path)
+        sample['items'] = len(grouped_orders)
+
+    # POs with a bad line are held back whole rather than placed with lines missing
+    if rejected_pos:
+        for po_num, count in rejected_pos.items():
+            grouped_orders.pop(po_num, None)
+            failed_orders.append((file, po_num or '(no PO)', f'{count} rejected lines'))
+        message = (f"{sum(rejected_pos.values())} rows of {file} failed validation; {len(rejected_pos)} POs were "
+                   f"not placed. The rejected rows are in {reject_path}.")
+        print(message)
+        send_email("Fromuth Order Rows Rejected", message, attachments=[reject_path])
+
+    if seen_pos is not None:
+        for po_num in list(grouped_orders):
+            if po_num not in seen_pos:
+                seen_pos[po_num] = (file, grouped_orders[po_num])
+                continue
+            previous_file, previous_order = seen_pos[po_num]
+            order = grouped_orders.pop(po_num)
+            if order == previous_order:
+                print(f'Order {po_num} is repeated from {previous_file}, skipping.')
+            else:
+                error = f'differs from the same PO in {previous_file}; only that one was processed'
+                print(f"Order {po_num} in {file} {error}")
+                failed_orders.append((file, po_num, error))
+
+    # stock pre-flight against the local inventory index, no API calls; POs the ledger already
+    # has as placed will be skipped, so they are neither checked nor counted against stock
+    reserved_pos = set()
+    if stock_check is not None and stock_check.enabled:
+        stock_check.ensure_fresh()
+        rejects = stock_check.rejects
+        for po_num in list(grouped_orders):
+            if ledger.status(po_num) == PLACED:
+                continue
+            reserved_pos.add(po_num)
+            problems = stock_check.check(grouped_orders[po_num]['items'])
+            if not problems:
+                stock_check.reserve(grouped_orders[po_num]['items'])
+                continue
+            message = f"Order {po_num} from file {file}: {'; '.join(problems)}"
+            if rejects:
+                grouped_orders.pop(po_num)
+                reserved_pos.discard(po_num)
+                print(f"{message}; not placed")
+                failed_orders.append((file, po_num, '; '.join(problems)))
+            else:
+                stock_check.reserve(grouped_orders[po_num]['items'])
+                print(f"Stock warning: {message}")
+            send_error_email("Fromuth Order Stock Check", message)
+
+    # independent POs are checked and placed in parallel; results are handled here in file order
+    print(f'placing {len(grouped_orders)} orders with {ORDER_CONCURRENCY} workers...')
+    results = {}
+    with metrics.stage('orders.place'), ThreadPoolExecutor(max_workers=ORDER_CONCURRENCY) as executor:
+        futures = {
+            executor.submit(metrics.propagate(submit_po), file, po_num, order, headers, ledger): po_num
+            for po_num, order in grouped_orders.items()
+        }
+        for future in as_completed(futures):
+            po_num = futures[future]
+            outcome, result = results[po_num] = future.result()
+            # journal the sheet row as soon as the order is placed, so a crash or timeout later
+            # in the batch can't leave a placed order without one
+            if outcome == 'placed' and result and result.get('order_number'):
+                sheet_writer.add(po_num, result['order_number'])
+
+    for po_num in grouped_orders:
+        outcome, result = results[po_num]
+        if outcome != 'placed' and po_num in reserved_pos:
+            # nothing was sent, so later POs can still have this stock
+            stock_check.release(grouped_orders[po_num]['items'])
+        try:
+            if outcome == 'skipped':
+                print(f'Order {po_num} was not sent ({result}).')
                 continue
+            if outcome == 'failed':
+                raise Exception(result)
 
-            print('placing orders...')
-            order_response = place_order(po_num, order, headers)
+            order_response = result
             print(f"Successfully placed order. Fromuth Order Number: {order_response.get('order_number')}; "
                   f"Flip Order Number: {order_response.get('customer_order_number')}.")
             
@@ -100,12 +308,8 @@ def process_order_file(file, headers, archive_dir, successful_orders, failed_ord
                 warning_msgs = " ; ".join([f"[{w.get('code')}] {w.get('title')}" for w in warnings])
                 print("Warnings:", warning_msgs)
             
-            # add the order number to a google sheet for shipment tracking
-            print('adding order info to google sheet')
-            fromuth_order_num = order_response.get('order_number')
-            if fromuth_order_num:
-                add_po_num_fromuth_num_to_sheet(sheet, po_num, fromuth_order_num, po_num_col=1, fromuth_num_col=2)
-            else:
+            # the order number was journaled for the google sheet as soon as the order was placed
+            if not order_response.get('order_number'):
                 print('order number not found')
 
             successful_orders.append((file, po_num))
@@ -113,7 +317,7 @@ def process_order_file(file, headers, archive_dir, successful_orders, failed_ord
         except Exception as e:
             print(f"Error processing order {po_num} from file {file}: {str(e)}")
             failed_orders.append((file, po_num, str(e)))
-            send_email("Fromuth Order Processing Error", f"Error processing order {po_num} from file {file}: {str(e)}")
+            send_error_email("Fromuth Order Processing Error", f"Error processing order {po_num} from file {file}: {str(e)}")
 
     # archive the processed file
     try:
@@ -121,3 +325,66 @@ def process_order_file(file, headers, archive_dir, successful_orders, failed_ord
         print(f"Moved {file} to archive")
     except Exception as e:
         print(f"Failed to move {file} to archive: {str(e)}")
+
+def process_order_files(files, sheet=None):
+    """
+    Place the orders in already downloaded files, archive them locally and send the summary email.
+    Returns True if every file and order went through.
+    """
+    # setup local archive directory
+    archive_dir = os.path.join(LOCAL_ORDERS_DIR, 'processed')
+    os.makedirs(archive_dir, exist_ok=True)
+
+    # authenticate with API
+    try:
+        token = get_jwt()
+    except APIError as e:
+        error_message = f"Failed to authenticate with API: {str(e)}"
+        print(error_message)
+        send_email("Fromuth Authentication Error", error_message)
+        return False
+
+    headers = {'Authorization': f'Bearer {token}'}
+
+    successful_orders = []
+    failed_orders = []
+    failed_files = []
+    seen_pos = {}  # POs already handled in this run, across files
+    ledger = open_ledger(sheet or setup_google_sheets())
+    stock_check = open_stock_check()
+
+    # process downloaded order files & place the orders
+    for file in files:
+        try:
+            process_order_file(file, headers, archive_dir, successful_orders, failed_orders, sheet, ledger, seen_pos,
+                               stock_check)
+        except Exception as e:
+            error_message = f"Error processing file {file}: {str(e)}"
+            print(error_message)
+            send_error_email("Fromuth Order File Failed", error_message)
+            failed_files.append(file)
+    ledger.close()
+    stock_check.close()
+
+    # send summary email
+    print('sending summary email')
+    subject = "Fromuth Order Summary"
+    successful_msg = ', '.join(f'{po_num} ({f})' for f, po_num in successful_orders) if successful_orders else "None"
+    failed_msg = ', '.join(f'{po_num} ({f})' for f, po_num, _ in failed_orders) if failed_orders else "None"
+    # failed_msg = ', '.join(f'{po_num} ({f}): {e}' for f, po_num, e in failed_orders) if failed_orders else "None"
+
+    body = f"""
+        Successful orders: {len(successful_orders)}
+        {successful_msg}
+
+        Failed orders: {len(failed_orders)}
+        {failed_msg}
+        """
+    # attach the run's performance report as it stands once the orders are done
+    try:
+        attachments = [metrics.write_report()]
+    except OSError as e:
+        print(f"could not write the performance report: {e}")
+        attachments = []
+    send_email(subject, body, attachments=attachments)
+    return not failed_files and not failed_orders
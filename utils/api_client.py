@@ -0,0 +1,122 @@
+import os
+import time
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+API_BASE_URL = os.getenv('API_BASE_URL')
+
+# (connect, read) timeouts in seconds, overridable per call
+DEFAULT_TIMEOUT = (
+    float(os.getenv('API_CONNECT_TIMEOUT', '10')),
+    float(os.getenv('API_READ_TIMEOUT', '60')),
+)
+POOL_SIZE = int(os.getenv('API_POOL_SIZE', '16'))
+MAX_RETRIES = 4
+BACKOFF_FACTOR = 1  # 0s, 2s, 4s, 8s between attempts
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_metrics_hook = None
+_auth_handler = None
+
+def build_session():
+    """
+    Build a keep-alive session shared by every API call.
+    Retries connection errors for every method, but only retries error statuses (including
+    429 rate limits, honoring Retry-After) for idempotent methods, so an order POST is
+    never silently submitted twice.
+    """
+    retry = Retry(
+        total=MAX_RETRIES,
+        connect=MAX_RETRIES,
+        read=0,
+        status=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Accept': 'application/json', 'Accept-Encoding': 'gzip, deflate'})
+    return session
+
+def get_session():
+    global _session
+    if _session is None:
+        _session = build_session()
+    return _session
+
+def set_metrics_hook(hook):
+    """
+    Register a callable receiving (method, path, status, elapsed_seconds, response_bytes)
+    after every API call. status is None when the request raised. Pass None to remove it.
+    """
+    global _metrics_hook
+    _metrics_hook = hook
+
+def set_auth_handler(handler):
+    """
+    Register an object with resolve(token) and refresh(rejected_token) methods, both returning
+    the bearer token to use. resolve() runs before every authenticated request, and refresh()
+    after a 401, which is then retried once.
+    """
+    global _auth_handler
+    _auth_handler = handler
+
+def _bearer_token(headers):
+    auth = (headers or {}).get('Authorization', '')
+    return auth[len('Bearer '):] if auth.startswith('Bearer ') else None
+
+def _report(method, path, status, elapsed, size):
+    if _metrics_hook is None:
+        return
+    try:
+        _metrics_hook(method, path, status, elapsed, size)
+    except Exception as e:
+        logger.warning(f"metrics hook failed: {e}")
+
+def api_request(method, path, timeout=None, **kwargs):
+    """
+    Send a request to `API_BASE_URL + path` through the shared session.
+    Returns the response without raising on HTTP error statuses; callers decide how to handle them.
+    """
+    url = f'{API_BASE_URL}{path}'
+    headers = kwargs.get('headers')
+    token = _bearer_token(headers)
+    if token and _auth_handler is not None:
+        # the caller's headers dict is updated in place so later calls reuse the fresh token
+        token = _auth_handler.resolve(token)
+        headers['Authorization'] = f'Bearer {token}'
+
+    response = _send(method, url, path, timeout, **kwargs)
+    if response.status_code == 401 and token and _auth_handler is not None:
+        logger.info(f"{method} {path} returned 401, retrying with a fresh token")
+        headers['Authorization'] = f'Bearer {_auth_handler.refresh(token)}'
+        response = _send(method, url, path, timeout, **kwargs)
+    return response
+
+def _send(method, url, path, timeout, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = get_session().request(method, url, timeout=timeout or DEFAULT_TIMEOUT, **kwargs)
+    except requests.RequestException:
+        _report(method, path, None, time.perf_counter() - start, 0)
+        raise
+    _report(method, path, response.status_code, time.perf_counter() - start, len(response.content))
+    return response
+
+def api_get(path, **kwargs):
+    return api_request('GET', path, **kwargs)
+
+def api_post(path, **kwargs):
+    return api_request('POST', path, **kwargs)
@@ -1,5 +1,11 @@
 import os
-import requests
+import json
+import time
+import fcntl
+import base64
+import threading
+from utils.api_client import api_post, set_auth_handler
+from utils.db_utils import STATE_DIR
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,6 +17,11 @@ API_PASSWORD = os.getenv('API_PASSWORD')
 API_STAGING_PASSWORD = os.getenv('API_STAGING_PASSWORD')
 LOCAL_ORDERS_DIR = os.getenv('LOCAL_ORDERS_DIR')
 
+# on-disk token cache shared between runs; set JWT_CACHE_FILE to an empty string to keep it in memory only
+JWT_CACHE_FILE = os.getenv('JWT_CACHE_FILE', os.path.join(STATE_DIR, 'jwt_cache.json'))
+JWT_REFRESH_MARGIN = 120   # seconds before expiry at which the token is refreshed
+JWT_DEFAULT_TTL = 50 * 60  # assumed lifetime when the token carries no exp claim
+
 class APIError(Exception):
     def __init__(self, data):
         self.title = data.get('title', 'API Error')
@@ -21,16 +32,125 @@ class APIError(Exception):
         message = f"{self.title} (status: {self.status}, code: {self.code})"
         super().__init__(message)
 
-def get_jwt():
-    auth_url = f'{API_BASE_URL}/auth/login'
+def login():
+    """
+    Log in to the API and return a fresh JWT.
+    """
     payload = {
         "username": API_USERNAME,
         "password": API_PASSWORD,
     }
-    response = requests.post(auth_url, json=payload)
+    response = api_post('/auth/login', json=payload)
     data = response.json()
     if response.ok:
         token = data.get('data', {}).get('jwt', {}).get('token')
         return token
     else:
-        raise APIError(data)
\ No newline at end of file
+        raise APIError(data)
+
+def decode_jwt_expiry(token):
+    """
+    Return the exp claim of a JWT as a unix timestamp, or None if it can't be read.
+    The signature is not verified; this is only used to decide when to refresh.
+    """
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get('exp')
+        return float(exp) if exp is not None else None
+    except (IndexError, ValueError, AttributeError):
+        return None
+
+class TokenManager:
+    """
+    Caches the JWT in memory (and optionally on disk) and refreshes it ahead of expiry.
+    Also acts as the api_client auth handler: requests carrying a superseded token are sent
+    with the current one, and a 401 triggers a single refresh shared by all threads.
+    """
+
+    def __init__(self, cache_file=JWT_CACHE_FILE):
+        self.cache_file = cache_file
+        self._lock = threading.Lock()
+        self._token = None
+        self._expires_at = 0
+        self._superseded = set()
+
+    def _is_fresh(self, expires_at):
+        return time.time() < expires_at - JWT_REFRESH_MARGIN
+
+    def _set_token(self, token, expires_at=None):
+        if self._token and self._token != token:
+            self._superseded.add(self._token)
+        self._token = token
+        self._expires_at = expires_at or decode_jwt_expiry(token) or time.time() + JWT_DEFAULT_TTL
+
+    def _read_disk(self):
+        try:
+            with open(self.cache_file) as f:
+                cached = json.load(f)
+            return cached['token'], cached['expires_at']
+        except (OSError, ValueError, KeyError):
+            return None, 0
+
+    def _write_disk(self):
+        # 0600 so the token is only readable by the account running the bot
+        fd = os.open(self.cache_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.fchmod(fd, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'token': self._token, 'expires_at': self._expires_at}, f)
+
+    def _login(self, stale_token=None):
+        """
+        Replace the current token, preferring a fresh one another process left on disk.
+        The disk cache is read and written under an exclusive lock so concurrent runs log in once.
+        """
+        if not self.cache_file:
+            self._set_token(login())
+            return
+
+        os.makedirs(os.path.dirname(self.cache_file) or '.', exist_ok=True)
+        lock_fd = os.open(f'{self.cache_file}.lock', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            token, expires_at = self._read_disk()
+            if token and token != stale_token and self._is_fresh(expires_at):
+                self._set_token(token, expires_at)
+                return
+            self._set_token(login())
+            self._write_disk()
+        finally:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
+
+    def get_token(self):
+        with self._lock:
+            if not self._token or not self._is_fresh(self._expires_at):
+                self._login(stale_token=self._token)
+            return self._token
+
+    def resolve(self, token):
+        """
+        Return the token a request should be sent with.
+        Tokens issued by this manager are swapped for the current one (refreshing it if it is
+        about to expire); any other token is left untouched.
+        """
+        if token == self._token or token in self._superseded:
+            return self.get_token()
+        return token
+
+    def refresh(self, rejected_token):
+        """
+        Called after a 401. Logs in again unless another thread already replaced the rejected token.
+        """
+        with self._lock:
+            if self._token and self._token != rejected_token and self._is_fresh(self._expires_at):
+                return self._token
+            self._superseded.add(rejected_token)
+            self._login(stale_token=rejected_token)
+            return self._token
+
+token_manager = TokenManager()
+set_auth_handler(token_manager)
+
+def get_jwt():
+    return token_manager.get_token()
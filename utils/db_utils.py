@@ -0,0 +1,21 @@
+import os
+import sqlite3
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# local state (snapshots, caches, ledgers) lives here, one sqlite file per store
+STATE_DIR = os.getenv('STATE_DIR', os.path.join(BASE_DIR, 'state'))
+
+def connect_db(name):
+    """
+    Open (and create if needed) the sqlite database `name` in STATE_DIR.
+    WAL mode lets readers keep working while another thread or process writes.
+    """
+    os.makedirs(STATE_DIR, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(STATE_DIR, f'{name}.db'), timeout=30, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
@@ -1,15 +1,34 @@
 import smtplib
+import atexit
+import queue
+import threading
+import time
+from collections import deque
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from email.mime.application import MIMEApplication
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 
-def send_email(subject, body):
+# point these at a local SMTP stand-in (with SMTP_STARTTLS=false) to test notifications
+SMTP_HOST = os.getenv('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
+SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'true').lower() in ('1', 'true', 'yes')
+# the SMTP session is closed after this many idle seconds and reopened on the next email
+SMTP_IDLE_TIMEOUT = float(os.getenv('SMTP_IDLE_TIMEOUT', '60'))
+
+# error emails are collected into digests: the first goes out EMAIL_DIGEST_DELAY seconds after
+# the first error, later ones at most every EMAIL_DIGEST_INTERVAL, and no more than
+# EMAIL_MAX_PER_HOUR digests an hour
+DIGEST_DELAY = float(os.getenv('EMAIL_DIGEST_DELAY', '30'))
+DIGEST_INTERVAL = float(os.getenv('EMAIL_DIGEST_INTERVAL', '300'))
+MAX_DIGESTS_PER_HOUR = int(os.getenv('EMAIL_MAX_PER_HOUR', '12'))
+
+def build_message(subject, body, attachments=()):
     sender_email = os.getenv('SENDER_EMAIL')
     receiver_email = os.getenv('RECEIVER_EMAIL')
-    email_password = os.getenv('EMAIL_PASSWORD')
 
     # create email msg headers
     msg = MIMEMultipart()
@@ -20,15 +39,160 @@ def send_email(subject, body):
     # create email msg body
     msg.attach(MIMEText(body, 'plain'))
 
-    # connect to the server and send the email
-    try:
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender_email, email_password)
-        text = msg.as_string()
-        server.sendmail(sender_email, receiver_email, text)
-        print("email sent successfully")
-    except Exception as e:
-        print(f"failed to send email: {e}")
-    finally:
-        server.quit()
\ No newline at end of file
+    # attach files, e.g. the run's performance report
+    for path in attachments:
+        try:
+            with open(path, 'rb') as f:
+                part = MIMEApplication(f.read(), Name=os.path.basename(path))
+            part['Content-Disposition'] = f'attachment; filename="{os.path.basename(path)}"'
+            msg.attach(part)
+        except OSError as e:
+            print(f"could not attach {path}: {e}")
+    return msg
+
+class EmailNotifier:
+    """
+    Sends email from a background thread over one SMTP session that is kept open between
+    messages, so callers never wait on the SMTP handshake.
+    Messages passed to send() go out in order as soon as possible. Errors passed to error()
+    are grouped by subject into digest emails, sent on the schedule above; flush() sends
+    whatever is queued, digests included, and waits for it.
+    """
+
+    def __init__(self, digest_delay=DIGEST_DELAY, digest_interval=DIGEST_INTERVAL, max_digests_per_hour=MAX_DIGESTS_PER_HOUR):
+        self.digest_delay = digest_delay
+        self.digest_interval = digest_interval
+        self.max_digests_per_hour = max_digests_per_hour
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.pending_errors = {}  # subject -> [bodies]
+        self.first_error_at = None
+        self.last_digest_at = 0
+        self.digest_times = deque()
+        self.server = None
+        self.last_used = 0
+        self.thread = None
+
+    def _start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='email-notifier', daemon=True)
+                self.thread.start()
+
+    def send(self, subject, body, attachments=()):
+        # attachments are read now, before the caller can move or delete them
+        self.queue.put(build_message(subject, body, attachments))
+        self._start()
+
+    def error(self, subject, body):
+        with self.lock:
+            self.pending_errors.setdefault(subject, []).append(body)
+            if self.first_error_at is None:
+                self.first_error_at = time.monotonic()
+        self._start()
+
+    def flush(self, timeout=60):
+        """
+        Send everything queued, including pending digests, and wait up to `timeout` seconds.
+        Returns True if it all went out in time.
+        """
+        with self.lock:
+            idle = self.queue.empty() and not self.pending_errors and (self.thread is None or not self.thread.is_alive())
+        if idle:
+            return True
+        done = threading.Event()
+        self.queue.put(done)
+        self._start()
+        return done.wait(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=1.0)
+            except queue.Empty:
+                item = None
+            if isinstance(item, threading.Event):
+                self._send_digests(force=True)
+                self._disconnect()
+                item.set()
+                continue
+            if item is not None:
+                self._deliver(item)
+            self._send_digests()
+            if self.server is not None and time.monotonic() - self.last_used > SMTP_IDLE_TIMEOUT:
+                self._disconnect()
+
+    def _digest_due(self, now):
+        if now - self.first_error_at < self.digest_delay or now - self.last_digest_at < self.digest_interval:
+            return False
+        while self.digest_times and now - self.digest_times[0] > 3600:
+            self.digest_times.popleft()
+        return len(self.digest_times) < self.max_digests_per_hour
+
+    def _send_digests(self, force=False):
+        now = time.monotonic()
+        with self.lock:
+            if not self.pending_errors or not (force or self._digest_due(now)):
+                return
+            pending, self.pending_errors = self.pending_errors, {}
+            self.first_error_at = None
+            self.last_digest_at = now
+            self.digest_times.append(now)
+        for subject, bodies in pending.items():
+            if len(bodies) == 1:
+                self._deliver(build_message(subject, bodies[0]))
+            else:
+                self._deliver(build_message(f"{subject} ({len(bodies)} errors)", "\n\n".join(bodies)))
+
+    def _connect(self):
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30)
+        if SMTP_STARTTLS:
+            server.starttls()
+        email_password = os.getenv('EMAIL_PASSWORD')
+        if email_password:
+            server.login(os.getenv('SENDER_EMAIL'), email_password)
+        return server
+
+    def _disconnect(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            self.server.close()
+        self.server = None
+
+    def _deliver(self, msg):
+        # a session the server has dropped is only noticed on use, so retry once on a new one
+        error = None
+        for _ in range(2):
+            try:
+                if self.server is None:
+                    self.server = self._connect()
+                self.server.send_message(msg)
+                self.last_used = time.monotonic()
+                print(f"email sent successfully: {msg['Subject']}")
+                return True
+            except (smtplib.SMTPException, OSError) as e:
+                error = e
+                self._disconnect()
+        print(f"failed to send email: {error}")
+        return False
+
+notifier = EmailNotifier()
+atexit.register(notifier.flush)
+
+def send_email(subject, body, attachments=()):
+    """
+    Queue an email; it is sent in the background without blocking the caller.
+    """
+    notifier.send(subject, body, attachments)
+
+def send_error_email(subject, body):
+    """
+    Queue an error notification to be coalesced with others of the same subject into a digest.
+    """
+    notifier.error(subject, body)
+
+def flush_emails(timeout=60):
+    return notifier.flush(timeout)
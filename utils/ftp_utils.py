@@ -1,8 +1,17 @@
 import os
-import logging
 import sys
+import gzip
+import time
+import queue
+import shutil
+import hashlib
+import tempfile
+import logging
+import threading
 from dotenv import load_dotenv 
 from ftplib import FTP, error_perm, error_temp, error_reply
+from utils.db_utils import connect_db
+from utils.metrics import metrics
 
 load_dotenv()
 
@@ -10,6 +19,7 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 FTP_HOST = os.getenv('FTP_HOST')
+FTP_PORT = int(os.getenv('FTP_PORT', '21'))
 FTP_USER = os.getenv('FTP_USER')
 FTP_PASS = os.getenv('FTP_PASS')
 LOCAL_ORDERS_DIR = os.getenv('LOCAL_ORDERS_DIR')
@@ -19,10 +29,17 @@ REMOTE_ORDERS_DIR = '/out/orders'
 REMOTE_ORDER_ARCHIVE_DIR = '/out/orders/archive' 
 REMOTE_INVENTORY_DIR = '/in/inventory'
 
+# uploads use a larger block than ftplib's 8 KiB default
+UPLOAD_BLOCKSIZE = 256 * 1024
+# also publish <name>.gz next to every upload
+UPLOAD_GZIP_COPY = os.getenv('FTP_UPLOAD_GZIP', '').lower() in ('1', 'true', 'yes')
+
 def connect_ftp():
    try:
-       ftp = FTP(FTP_HOST)
-       ftp.login(FTP_USER, FTP_PASS)
+       with metrics.timer('ftp', 'connect'):
+           ftp = FTP()
+           ftp.connect(FTP_HOST, FTP_PORT)
+           ftp.login(FTP_USER, FTP_PASS)
        logger.info(f"successfully connected to FTP server: {FTP_HOST}")
        return ftp
    except (error_perm, error_temp, error_reply, Exception) as e:
@@ -52,11 +69,82 @@ def download_files(ftp):
        logger.error(f"error during file download: {e}")
        return []
 
-def upload_files(ftp, local_file_path, remote_file_name):
+def file_sha256(path, chunk_size=1024 * 1024):
+   digest = hashlib.sha256()
+   with open(path, 'rb') as f:
+       for chunk in iter(lambda: f.read(chunk_size), b''):
+           digest.update(chunk)
+   return digest.hexdigest()
+
+def _upload_db():
+   conn = connect_db('ftp_uploads')
+   conn.execute('CREATE TABLE IF NOT EXISTS uploads (remote_path TEXT PRIMARY KEY, sha256 TEXT, uploaded_at REAL)')
+   return conn
+
+def upload_is_current(remote_file_name, content_hash, remote_dir=REMOTE_INVENTORY_DIR):
+   """
+   True if a file with this content hash was the last one uploaded to `remote_dir/remote_file_name`.
+   """
+   conn = _upload_db()
+   try:
+       row = conn.execute('SELECT sha256 FROM uploads WHERE remote_path = ?', (f"{remote_dir}/{remote_file_name}",)).fetchone()
+   finally:
+       conn.close()
+   return row is not None and row[0] == content_hash
+
+def _record_upload(remote_file_name, content_hash, remote_dir):
+   conn = _upload_db()
+   try:
+       conn.execute('INSERT OR REPLACE INTO uploads VALUES (?, ?, ?)', (f"{remote_dir}/{remote_file_name}", content_hash, time.time()))
+       conn.commit()
+   finally:
+       conn.close()
+
+def store_atomic(ftp, local_file, remote_file_name):
+   """
+   Upload to a temporary name in the current remote directory, then rename it over
+   `remote_file_name` so readers never see a partially written file.
+   """
+   tmp_name = f".{remote_file_name}.uploading"
+   start = time.perf_counter()
+   with metrics.timer('ftp', 'upload') as sample:
+       ftp.storbinary(f'STOR {tmp_name}', local_file, blocksize=UPLOAD_BLOCKSIZE)
+       try:
+           ftp.rename(tmp_name, remote_file_name)
+       except error_perm:
+           # some servers refuse to rename over an existing file
+           ftp.delete(remote_file_name)
+           ftp.rename(tmp_name, remote_file_name)
+       size = sample['bytes'] = local_file.tell()
+   elapsed = time.perf_counter() - start
+   logger.info(f"uploaded: {remote_file_name} ({size} bytes in {elapsed:.2f}s)")
+
+def upload_files(ftp, local_file_path, remote_file_name, content_hash=None, gzip_copy=UPLOAD_GZIP_COPY):
+   """
+   Upload a file to REMOTE_INVENTORY_DIR, skipping it if the same content was uploaded last time.
+   Optionally publishes a gzip copy next to it as `<remote_file_name>.gz`.
+   Returns True if the file was uploaded, False if it was skipped.
+   """
    try:
+       content_hash = content_hash or file_sha256(local_file_path)
+       if upload_is_current(remote_file_name, content_hash):
+           logger.info(f"{remote_file_name} unchanged since last upload, skipping")
+           return False
+
        ftp.cwd(REMOTE_INVENTORY_DIR)
        with open(local_file_path, 'rb') as local_file:
-           ftp.storbinary(f'STOR {remote_file_name}', local_file)
+           store_atomic(ftp, local_file, remote_file_name)
+
+       if gzip_copy:
+           with tempfile.TemporaryFile() as gz_file:
+               with open(local_file_path, 'rb') as local_file, \
+                       gzip.GzipFile(filename=remote_file_name, mode='wb', fileobj=gz_file, compresslevel=6) as gz:
+                   shutil.copyfileobj(local_file, gz, UPLOAD_BLOCKSIZE)
+               gz_file.seek(0)
+               store_atomic(ftp, gz_file, f"{remote_file_name}.gz")
+
+       _record_upload(remote_file_name, content_hash, REMOTE_INVENTORY_DIR)
+       return True
    except Exception as e:
        logger.error(f"error during file upload: {e}")
        sys.exit(1)
@@ -74,4 +162,166 @@ def archive_files_on_ftp(ftp, files):
            logger.info(f"archived file on FTP: {file_name}")
    except Exception as e:
        logger.error(f"error archiving files on FTP: {e}")
-       sys.exit(1)
\ No newline at end of file
+       sys.exit(1)
+
+# parallel order download engine
+FTP_WORKERS = int(os.getenv('FTP_WORKERS', '3'))
+
+def remote_size(ftp, file_name):
+   try:
+       ftp.voidcmd('TYPE I')
+       return ftp.size(file_name)
+   except (error_perm, error_reply):
+       return None
+
+def download_file_resumable(ftp, file_name, local_dir=None):
+   """
+   Download `file_name` from the current remote directory into `local_dir`.
+   Data goes to `<name>.part`, resuming with REST from whatever a previous attempt left
+   behind, and is renamed to its final name only once the size matches the remote file.
+   Returns the number of bytes transferred in this call.
+   """
+   local_dir = local_dir or LOCAL_ORDERS_DIR
+   local_file_path = os.path.join(local_dir, file_name)
+   part_path = f"{local_file_path}.part"
+   size = remote_size(ftp, file_name)
+   offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+   if size is None or offset > size:
+       offset = 0  # can't trust a partial file we can't verify
+
+   transferred = 0
+   if size is None or offset < size:
+       with metrics.timer('ftp', 'download') as sample, open(part_path, 'ab' if offset else 'wb') as local_file:
+           def write(chunk):
+               nonlocal transferred
+               local_file.write(chunk)
+               transferred += len(chunk)
+           try:
+               ftp.retrbinary(f'RETR {file_name}', write, rest=offset or None)
+           finally:
+               sample['bytes'] = transferred
+
+   if size is not None and os.path.getsize(part_path) != size:
+       raise IOError(f"{file_name}: downloaded {os.path.getsize(part_path)} of {size} bytes")
+   os.replace(part_path, local_file_path)
+   return transferred
+
+def list_order_fingerprints(ftp):
+   """
+   Return {file_name: (size, modify time)} for the order CSVs in REMOTE_ORDERS_DIR.
+   Uses a single MLSD listing where the server supports it, falling back to NLST plus SIZE/MDTM.
+   """
+   try:
+       with metrics.timer('ftp', 'mlsd'):
+           entries = list(ftp.mlsd(REMOTE_ORDERS_DIR, facts=['type', 'size', 'modify']))
+       return {
+           name: (facts.get('size'), facts.get('modify'))
+           for name, facts in entries
+           if facts.get('type', 'file') == 'file' and name.endswith('.csv')
+       }
+   except error_perm:
+       pass
+
+   ftp.cwd(REMOTE_ORDERS_DIR)
+   fingerprints = {}
+   for name in ftp.nlst():
+       if not name.endswith('.csv'):
+           continue
+       try:
+           modify = ftp.voidcmd(f'MDTM {name}').split()[-1]
+       except (error_perm, error_reply):
+           modify = None
+       fingerprints[name] = (remote_size(ftp, name), modify)
+   return fingerprints
+
+def archive_file_on_ftp(ftp, file_name):
+   with metrics.timer('ftp', 'archive'):
+       ftp.rename(f"{REMOTE_ORDERS_DIR}/{file_name}", f"{REMOTE_ORDER_ARCHIVE_DIR}/{file_name}")
+   logger.info(f"archived file on FTP: {file_name}")
+
+def _download_worker(file_queue, downloaded_files, failed_connections, lock, archive):
+   ftp = connect_ftp()
+   if not ftp:
+       with lock:
+           failed_connections.append(threading.current_thread().name)
+       return
+   try:
+       ftp.cwd(REMOTE_ORDERS_DIR)
+       while True:
+           try:
+               file_name = file_queue.get_nowait()
+           except queue.Empty:
+               return
+           try:
+               start = time.perf_counter()
+               transferred = download_file_resumable(ftp, file_name)
+               elapsed = time.perf_counter() - start
+               logger.info(f"downloaded: {file_name} ({transferred} bytes in {elapsed:.2f}s, "
+                           f"{transferred / 1024 / max(elapsed, 1e-6):.1f} KiB/s)")
+               # archive as soon as the file is safely on disk
+               if archive:
+                   archive_file_on_ftp(ftp, file_name)
+               with lock:
+                   downloaded_files.append(file_name)
+           except Exception as e:
+               logger.error(f"error downloading {file_name}: {e}")
+   finally:
+       try:
+           ftp.quit()
+       except Exception:
+           ftp.close()
+
+def download_order_files(workers=FTP_WORKERS, archive=True):
+   """
+   Download every order CSV from REMOTE_ORDERS_DIR over a small pool of FTP connections.
+   Each file is archived on the FTP as soon as it has been written locally, and a failed
+   file doesn't discard the others. Returns the names of the files that were downloaded,
+   [] if the directory couldn't be listed, or None if the FTP couldn't be reached.
+   """
+   ftp = connect_ftp()
+   if not ftp:
+       return None
+   try:
+       ftp.cwd(REMOTE_ORDERS_DIR)
+       files = ftp.nlst()
+       logger.info(f"list of files in remote directory: {files}")
+       if archive:
+           try:
+               ftp.cwd(REMOTE_ORDER_ARCHIVE_DIR)
+           except error_perm:
+               ftp.mkd(REMOTE_ORDER_ARCHIVE_DIR) # create archive dir if it doesn't exist
+   except Exception as e:
+       # e.g. some servers answer NLST on an empty directory with a 550
+       logger.error(f"error listing remote orders directory: {e}")
+       return []
+   finally:
+       try:
+           ftp.quit()
+       except Exception:
+           ftp.close()
+
+   csv_files = [f for f in files if f.endswith('.csv')]
+   if not csv_files:
+       return []
+
+   file_queue = queue.Queue()
+   for file_name in csv_files:
+       file_queue.put(file_name)
+   downloaded_files = []
+   failed_connections = []
+   lock = threading.Lock()
+   threads = [
+       threading.Thread(target=metrics.propagate(_download_worker), args=(file_queue, downloaded_files, failed_connections, lock, archive))
+       for _ in range(min(workers, len(csv_files)))
+   ]
+   for thread in threads:
+       thread.start()
+   for thread in threads:
+       thread.join()
+
+   if len(failed_connections) == len(threads):
+       logger.error(f"no download worker could connect to the FTP; {len(csv_files)} files left on the server")
+       return None
+
+   # keep the remote listing order
+   return [f for f in csv_files if f in downloaded_files]
@@ -1,18 +1,129 @@
+import os
+import json
+import time
+import threading
 import gspread
 from google.oauth2.service_account import Credentials
+from utils.db_utils import STATE_DIR
+from utils.metrics import metrics
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GSHEET_CREDS_FILE = 'utils/gsheet_creds.json'
+GSHEET_TITLE = "fromuth tracking"
+# opening by key skips the Drive search that opening by title needs
+GSHEET_KEY = os.getenv('GSHEET_KEY')
+
+# rows queued for the sheet but not yet written, replayed on the next run after a crash
+PENDING_ROWS_FILE = os.path.join(STATE_DIR, 'sheet_pending_rows.jsonl')
+
+_session = None
+_session_lock = threading.Lock()
+
+class TimedSheet:
+    """
+    Worksheet proxy that records every method call in the run's metrics ('sheets' category),
+    so each run can report where its Sheets quota goes.
+    """
+
+    def __init__(self, worksheet):
+        self._worksheet = worksheet
+
+    def __getattr__(self, name):
+        attr = getattr(self._worksheet, name)
+        if not callable(attr):
+            return attr
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            ok = False
+            try:
+                result = attr(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                metrics.record('sheets', name, time.perf_counter() - start, ok=ok)
+        return timed
+
+class SheetSession:
+    """
+    One authorized gspread client and the opened tracking worksheet, shared by every workflow in a run.
+    """
+
+    def __init__(self, creds_file=GSHEET_CREDS_FILE, key=GSHEET_KEY, title=GSHEET_TITLE):
+        scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/spreadsheets",
+                 "https://www.googleapis.com/auth/drive.file", "https://www.googleapis.com/auth/drive"]
+        start = time.perf_counter()
+        creds = Credentials.from_service_account_file(creds_file, scopes=scope)
+        self.client = gspread.authorize(creds)
+        spreadsheet = self.client.open_by_key(key) if key else self.client.open(title)
+        self.sheet = TimedSheet(spreadsheet.sheet1)  # open the first sheet
+        print(f"opened google sheet in {time.perf_counter() - start:.2f}s")
+
+def get_sheet_session():
+    """
+    Return the process-wide SheetSession, authorizing on first use.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = SheetSession()
+    return _session
 
 # google sheets API setup
 def setup_google_sheets():
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/spreadsheets",
-             "https://www.googleapis.com/auth/drive.file", "https://www.googleapis.com/auth/drive"]
-    creds = Credentials.from_service_account_file('utils/gsheet_creds.json', scopes=scope)
-    client = gspread.authorize(creds)
-    sheet = client.open("fromuth tracking").sheet1  # open the first sheet
-    return sheet
+    return get_sheet_session().sheet
 
 def add_po_num_fromuth_num_to_sheet(sheet, po_num, order_number, po_num_col=1, fromuth_num_col=2):
     next_row = len(sheet.get_all_values()) + 1 # find the next available row
     
     # Update the specific columns with values
     sheet.update_cell(next_row, po_num_col, po_num)
-    sheet.update_cell(next_row, fromuth_num_col, order_number)
\ No newline at end of file
+    sheet.update_cell(next_row, fromuth_num_col, order_number)
+
+class SheetWriter:
+    """
+    Buffers PO / Fromuth order number mappings and appends them to the sheet in one call.
+    Every queued row is journaled to PENDING_ROWS_FILE first, so rows that were never flushed
+    (crash, quota error) are picked up and written by the next SheetWriter.
+    """
+
+    def __init__(self, sheet, po_num_col=1, fromuth_num_col=2, pending_file=PENDING_ROWS_FILE):
+        self.sheet = sheet
+        self.po_num_col = po_num_col
+        self.fromuth_num_col = fromuth_num_col
+        self.pending_file = pending_file
+        self.rows = self._load_pending()
+        if self.rows:
+            print(f"Recovered {len(self.rows)} unflushed sheet rows from a previous run")
+
+    def _load_pending(self):
+        try:
+            with open(self.pending_file) as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except OSError:
+            return []
+
+    def add(self, po_num, order_number):
+        row = [""] * max(self.po_num_col, self.fromuth_num_col)
+        row[self.po_num_col - 1] = po_num
+        row[self.fromuth_num_col - 1] = order_number
+        os.makedirs(os.path.dirname(self.pending_file), exist_ok=True)
+        with open(self.pending_file, 'a') as f:
+            f.write(json.dumps(row) + "\n")
+        self.rows.append(row)
+
+    def flush(self):
+        """
+        Append every buffered row after the last row of the sheet in a single request.
+        On failure the rows stay buffered and journaled, and the error is raised.
+        """
+        if not self.rows:
+            return 0
+        self.sheet.append_rows(self.rows, value_input_option='RAW', table_range='A1')
+        count = len(self.rows)
+        self.rows = []
+        os.remove(self.pending_file)
+        print(f"Appended {count} rows to the google sheet")
+        return count
@@ -0,0 +1,203 @@
+import os
+import json
+import gzip
+import sqlite3
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # parquet output is optional
+    pa = None
+    pq = None
+
+class JsonlOutput:
+    """
+    Gzipped JSON lines, one object per item keyed by the CSV column names.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.tmp_filename = f"{filename}.tmp"
+
+    def open(self, fieldnames):
+        self.fieldnames = fieldnames
+        self.file = gzip.open(self.tmp_filename, 'wt', encoding='utf-8', compresslevel=6)
+
+    def write_rows(self, rows):
+        fieldnames = self.fieldnames
+        self.file.writelines(json.dumps(dict(zip(fieldnames, row))) + "\n" for row in rows)
+
+    def close(self):
+        self.file.close()
+        os.replace(self.tmp_filename, self.filename)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.tmp_filename)
+
+class ParquetOutput:
+    """
+    Columnar Parquet file with every column stored as a string, matching the CSV.
+    Needs pyarrow; check ParquetOutput.available() first.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.tmp_filename = f"{filename}.tmp"
+
+    @staticmethod
+    def available():
+        return pa is not None
+
+    def open(self, fieldnames):
+        self.fieldnames = fieldnames
+        self.schema = pa.schema([(name, pa.string()) for name in fieldnames])
+        self.writer = pq.ParquetWriter(self.tmp_filename, self.schema, compression='zstd')
+
+    def write_rows(self, rows):
+        columns = [[("" if value is None else str(value)) for value in column] for column in zip(*rows)]
+        if columns:
+            self.writer.write_table(pa.Table.from_arrays(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+        os.replace(self.tmp_filename, self.filename)
+
+    def abort(self):
+        self.writer.close()
+        os.remove(self.tmp_filename)
+
+class SqliteIndexOutput:
+    """
+    SQLite index of stock and prices keyed by itemcode, with sku and upc indexes for point lookups.
+    Built in a temp file and swapped into place, so readers always see a complete index.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.tmp_filename = f"{filename}.tmp"
+
+    def open(self, fieldnames):
+        if os.path.exists(self.tmp_filename):
+            os.remove(self.tmp_filename)
+        self.fieldnames = fieldnames
+        self.positions = {name: fieldnames.index(name) for name in ("itemcode", "sku", "upc", "name", "inventory")}
+        base_count = fieldnames.index("inventory") + 1
+        self.price_columns = [
+            (name, i) for i, name in enumerate(fieldnames[base_count:], start=base_count)
+            if not name.startswith("image")
+        ]
+        self.conn = sqlite3.connect(self.tmp_filename)
+        self.conn.execute('PRAGMA journal_mode=OFF')
+        self.conn.execute('PRAGMA synchronous=OFF')
+        self.conn.execute('''
+            CREATE TABLE items (
+                itemcode TEXT PRIMARY KEY,
+                sku TEXT,
+                upc TEXT,
+                name TEXT,
+                inventory INTEGER,
+                prices TEXT
+            )
+        ''')
+
+    def write_rows(self, rows):
+        p = self.positions
+        price_columns = self.price_columns
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?)',
+            (
+                (
+                    str(row[p["itemcode"]] or row[p["sku"]]), row[p["sku"]], row[p["upc"]], row[p["name"]],
+                    row[p["inventory"]] if row[p["inventory"]] != "" else None,
+                    json.dumps({name: row[i] for name, i in price_columns if row[i] != ""}),
+                )
+                for row in rows
+            )
+        )
+
+    def close(self):
+        self.conn.execute('CREATE INDEX items_sku ON items (sku)')
+        self.conn.execute('CREATE INDEX items_upc ON items (upc)')
+        self.conn.commit()
+        self.conn.close()
+        os.replace(self.tmp_filename, self.filename)
+
+    def abort(self):
+        self.conn.close()
+        os.remove(self.tmp_filename)
+
+class IndexQuantityOutput:
+    """
+    Updates stock and prices of an existing SqliteIndexOutput index in place from a
+    quantity-only refresh. Items that aren't in the index yet are left for the next full export.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.conn = None
+
+    def open(self, fieldnames):
+        if not os.path.exists(self.filename):
+            print(f"{self.filename} doesn't exist yet, run a full export to build it")
+            return
+        self.itemcode_pos = fieldnames.index("itemcode")
+        self.sku_pos = fieldnames.index("sku")
+        self.inventory_pos = fieldnames.index("inventory")
+        self.price_columns = [
+            (name, i) for i, name in enumerate(fieldnames[self.inventory_pos + 1:], start=self.inventory_pos + 1)
+            if not name.startswith("image")
+        ]
+        self.conn = sqlite3.connect(self.filename, timeout=30)
+
+    def write_rows(self, rows):
+        if self.conn is None:
+            return
+        price_columns = self.price_columns
+        self.conn.executemany(
+            'UPDATE items SET inventory = ?, prices = ? WHERE itemcode = ?',
+            (
+                (
+                    row[self.inventory_pos] if row[self.inventory_pos] != "" else None,
+                    json.dumps({name: row[i] for name, i in price_columns if row[i] != ""}),
+                    str(row[self.itemcode_pos] or row[self.sku_pos]),
+                )
+                for row in rows
+            )
+        )
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.commit()
+            self.conn.close()
+
+    def abort(self):
+        if self.conn is not None:
+            self.conn.rollback()
+            self.conn.close()
+
+class InventoryIndex:
+    """
+    Read-only point lookups against an index written by SqliteIndexOutput.
+    """
+
+    def __init__(self, filename):
+        self.conn = sqlite3.connect(f"file:{filename}?mode=ro", uri=True, check_same_thread=False)
+
+    def lookup(self, key):
+        """
+        Find an item by itemcode, sku or upc. Returns a dict with itemcode, sku, upc, name,
+        inventory and prices, or None if nothing matches.
+        """
+        for column in ("itemcode", "sku", "upc"):
+            row = self.conn.execute(
+                f'SELECT itemcode, sku, upc, name, inventory, prices FROM items WHERE {column} = ? LIMIT 1', (key,)
+            ).fetchone()
+            if row:
+                itemcode, sku, upc, name, inventory, prices = row
+                return {"itemcode": itemcode, "sku": sku, "upc": upc, "name": name,
+                        "inventory": inventory, "prices": json.loads(prices)}
+        return None
+
+    def close(self):
+        self.conn.close()
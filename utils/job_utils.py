@@ -0,0 +1,107 @@
+import os
+import time
+import fcntl
+import threading
+from contextlib import contextmanager
+from utils.db_utils import STATE_DIR
+from utils.metrics import metrics
+
+@contextmanager
+def job_lock(name):
+    """
+    Hold an exclusive, non-blocking lock file for `name` in STATE_DIR.
+    Yields False instead of waiting when another process already holds it.
+    """
+    os.makedirs(STATE_DIR, exist_ok=True)
+    fd = os.open(os.path.join(STATE_DIR, f'{name}.lock'), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        try:
+            yield True
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+class JobResult:
+    def __init__(self, name):
+        self.name = name
+        self.status = 'running'  # running, ok, failed, timeout, skipped
+        self.error = None
+        self.elapsed = 0.0
+
+    @property
+    def ok(self):
+        return self.status in ('ok', 'skipped')
+
+    def __str__(self):
+        detail = f": {self.error}" if self.error else ""
+        return f"{self.name}: {self.status} in {self.elapsed:.1f}s{detail}"
+
+def run_job(name, func, result=None):
+    """
+    Run one job under its lock file, recording its outcome in `result` (created if not given).
+    """
+    result = result or JobResult(name)
+    start = time.perf_counter()
+    try:
+        with job_lock(name) as acquired:
+            if not acquired:
+                result.status = 'skipped'
+                result.error = 'already running in another process'
+                return result
+            result.status = 'ok' if func() else 'failed'
+    except BaseException as e:  # SystemExit from sys.exit() in a workflow must not escape the thread
+        result.status = 'failed'
+        result.error = f"{type(e).__name__}: {e}"
+    finally:
+        result.elapsed = time.perf_counter() - start
+        metrics.record('job', name, result.elapsed, ok=result.ok)
+    return result
+
+def run_reported_job(name, func):
+    """
+    Run one job with metrics of its own and write its report when it finishes, for resident
+    processes that run jobs over and over. Runs that were skipped or found nothing to do
+    (no workflow stage ran, e.g. an order poll with no new files) leave no report.
+    """
+    with metrics.run(name) as run:
+        result = run_job(name, func)
+        if result.status != 'skipped' and (not result.ok or 'stage' in run.snapshot()):
+            try:
+                run.write_report(jobs={name: result.status})
+            except OSError as e:
+                print(f"could not write the {name} performance report: {e}")
+    return result
+
+def run_jobs(jobs, timeouts=None):
+    """
+    Run each job in `jobs` (name -> callable returning truthy on success) on its own thread.
+    Jobs are isolated from each other: an exception, sys.exit() or hang in one doesn't stop
+    the others. A job still running after its timeout is reported as 'timeout' and abandoned
+    (its daemon thread won't keep the process alive). Returns a list of JobResult.
+    """
+    timeouts = timeouts or {}
+    results = []
+    threads = []
+    for name, func in jobs.items():
+        result = JobResult(name)
+        thread = threading.Thread(target=run_job, args=(name, func, result), name=f'job-{name}', daemon=True)
+        thread.start()
+        results.append(result)
+        threads.append(thread)
+
+    start = time.monotonic()
+    for result, thread in zip(results, threads):
+        timeout = timeouts.get(result.name)
+        thread.join(None if timeout is None else max(0, timeout - (time.monotonic() - start)))
+        if thread.is_alive():
+            result.status = 'timeout'
+            result.elapsed = time.monotonic() - start
+    return results
@@ -0,0 +1,198 @@
+import os
+import re
+import json
+import math
+import time
+import threading
+import contextvars
+import functools
+from collections import deque
+from contextlib import contextmanager
+from utils.db_utils import STATE_DIR
+from utils.api_client import set_metrics_hook
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# per-run JSON reports; the newest METRICS_KEEP_REPORTS are kept
+REPORT_DIR = os.getenv('METRICS_REPORT_DIR', os.path.join(STATE_DIR, 'reports'))
+KEEP_REPORTS = int(os.getenv('METRICS_KEEP_REPORTS', '200'))
+# latencies kept per operation for percentiles; counts and totals are always exact
+MAX_SAMPLES = 10000
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def api_operation(method, path):
+    # group /order/<po> lookups into one operation instead of one per PO
+    if not path.startswith('/auth/'):
+        path = re.sub(r'^(/[^/]+)/.+$', r'\1/{id}', path)
+    return f"{method} {path}"
+
+class Stat:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes = 0
+        self.items = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=MAX_SAMPLES)
+
+    def as_dict(self):
+        samples = sorted(self.samples)
+        ms = lambda seconds: round(seconds * 1000, 1) if seconds is not None else None
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'bytes': self.bytes,
+            'items': self.items,
+            'total_s': round(self.total, 3),
+            'p50_ms': ms(percentile(samples, 0.50)),
+            'p95_ms': ms(percentile(samples, 0.95)),
+            'max_ms': ms(samples[-1] if samples else None),
+        }
+
+class Metrics:
+    """
+    Thread-safe counters and latencies for the bot's hot paths, grouped by category
+    (api, ftp, sheets, csv, stage, job) and operation name, for one run: the process for
+    main.py, or a single job run in the daemon (named after the job).
+    """
+
+    def __init__(self, name=None):
+        self.lock = threading.Lock()
+        self.stats = {}  # (category, name) -> Stat
+        self.started_at = time.time()
+        self.run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}" + (f"-{name}" if name else "")
+
+    def record(self, category, name, elapsed, bytes=0, items=0, ok=True):
+        with self.lock:
+            stat = self.stats.get((category, name))
+            if stat is None:
+                stat = self.stats[(category, name)] = Stat()
+            stat.count += 1
+            stat.errors += 0 if ok else 1
+            stat.bytes += bytes or 0
+            stat.items += items or 0
+            stat.total += elapsed
+            stat.samples.append(elapsed)
+
+    @contextmanager
+    def timer(self, category, name):
+        """
+        Time the block as one `category`/`name` operation. The yielded dict's 'bytes' and
+        'items' can be set inside the block; an exception records the operation as an error.
+        """
+        sample = {'bytes': 0, 'items': 0}
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield sample
+            ok = True
+        finally:
+            self.record(category, name, time.perf_counter() - start, sample['bytes'], sample['items'], ok)
+
+    def stage(self, name):
+        return self.timer('stage', name)
+
+    def record_api(self, method, path, status, elapsed, size):
+        # a 404 is the API's normal answer for an order that doesn't exist yet
+        ok = status is not None and (status < 400 or status == 404)
+        self.record('api', api_operation(method, path), elapsed, size, ok=ok)
+
+    def snapshot(self):
+        with self.lock:
+            stats = list(self.stats.items())
+        report = {}
+        for (category, name), stat in sorted(stats):
+            report.setdefault(category, {})[name] = stat.as_dict()
+        return report
+
+    def report(self, **extra):
+        return {
+            'run_id': self.run_id,
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_at)),
+            'elapsed_s': round(time.time() - self.started_at, 3),
+            **extra,
+            'metrics': self.snapshot(),
+        }
+
+    def write_report(self, **extra):
+        """
+        Write the run's report to REPORT_DIR/run-<run_id>.json (rewriting it if called again
+        later in the run) and return its path.
+        """
+        os.makedirs(REPORT_DIR, exist_ok=True)
+        path = os.path.join(REPORT_DIR, f"run-{self.run_id}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.report(**extra), f, indent=2)
+        os.replace(tmp_path, path)
+        reports = sorted(name for name in os.listdir(REPORT_DIR) if name.startswith('run-') and name.endswith('.json'))
+        for name in reports[:-KEEP_REPORTS]:
+            os.remove(os.path.join(REPORT_DIR, name))
+        return path
+
+    def print_summary(self):
+        for category, operations in self.snapshot().items():
+            for name, stat in operations.items():
+                size = f", {stat['bytes'] / 1024:.0f} KiB" if stat['bytes'] else ""
+                errors = f", {stat['errors']} errors" if stat['errors'] else ""
+                print(f"{category} {name}: {stat['count']} in {stat['total_s']:.2f}s "
+                      f"(p50 {stat['p50_ms']}ms, p95 {stat['p95_ms']}ms{size}{errors})")
+
+_current_run = contextvars.ContextVar('metrics_run', default=None)
+
+class CurrentMetrics:
+    """
+    The Metrics of the run in progress: the job run started with run() in this context, or
+    else the process-wide one. Worker threads don't inherit the context, so their targets
+    are wrapped with propagate().
+    """
+
+    def __init__(self):
+        self.process = Metrics()
+
+    def current(self):
+        return _current_run.get() or self.process
+
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
+
+    @contextmanager
+    def run(self, name):
+        """
+        Record everything done in this context into a fresh Metrics for one run of job `name`.
+        """
+        run = Metrics(name)
+        token = _current_run.set(run)
+        try:
+            yield run
+        finally:
+            _current_run.reset(token)
+
+    def propagate(self, func):
+        """
+        Wrap `func` so it records into the current run when called on another thread.
+        """
+        run = _current_run.get()
+        if run is None:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            token = _current_run.set(run)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _current_run.reset(token)
+        return wrapper
+
+metrics = CurrentMetrics()
+set_metrics_hook(lambda *args: metrics.current().record_api(*args))
@@ -0,0 +1,137 @@
+import os
+import time
+import threading
+from utils.db_utils import connect_db
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# set to send POs the seeded ledger has never seen without looking them up in the API first;
+# only safe when the tracking sheet lists every order ever placed
+TRUST_SEED = os.getenv('ORDER_LEDGER_TRUST_SEED', '').lower() in ('1', 'true', 'yes')
+# a PO another run claimed less than this many seconds ago is taken to still be in flight
+CLAIM_TIMEOUT = int(os.getenv('ORDER_LEDGER_CLAIM_TIMEOUT', '900'))
+
+SUBMITTING = 'submitting'
+PLACED = 'placed'
+FAILED = 'failed'
+
+class OrderLedger:
+    """
+    Durable record of every PO this bot has tried to place, keyed by PO number, along with
+    its Fromuth order number.
+    A PO is claimed (status 'submitting') before its order is sent and marked 'placed' or
+    'failed' afterwards, so a retrying worker or a restarted process never submits it twice
+    without first checking what happened. It is seeded with the PO mappings already in the
+    tracking sheet, so POs placed before it existed are skipped without an API call.
+    """
+
+    def __init__(self, name='order_ledger'):
+        self.conn = connect_db(name)
+        self.lock = threading.Lock()
+        self.run_id = f'{os.getpid()}-{time.time()}'
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS orders (
+                po_num TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                run_id TEXT NOT NULL,
+                file TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(orders)')]
+        if 'order_number' not in columns:
+            self.conn.execute('ALTER TABLE orders ADD COLUMN order_number TEXT')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.conn.commit()
+
+    @property
+    def seeded(self):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'seeded_at'").fetchone()
+        return row is not None
+
+    def seed(self, mappings):
+        """
+        Record (po_num, order_number) pairs placed before the ledger existed, e.g. the rows of
+        the tracking sheet. Existing entries are left alone.
+        """
+        with self.lock:
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO orders (po_num, status, run_id, order_number, updated_at) VALUES (?, ?, ?, ?, ?)',
+                ((po_num, PLACED, 'seed', order_number, time.time()) for po_num, order_number in mappings)
+            )
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('seeded_at', ?)", (str(time.time()),))
+            self.conn.commit()
+
+    def needs_remote_check(self, previous_status):
+        """
+        Whether a freshly claimed PO must be looked up in the API before it is sent: its last
+        attempt had an unknown outcome, or the ledger has never seen it. The seed is only a
+        snapshot of the tracking sheet, which misses orders placed without an order number and
+        rows trimmed from the sheet, so unseen POs are checked unless TRUST_SEED is set.
+        """
+        if previous_status in (SUBMITTING, FAILED):
+            return True
+        return previous_status is None and not (TRUST_SEED and self.seeded)
+
+    def claim(self, po_num, file):
+        """
+        Try to claim `po_num` for submission in this run.
+        Returns (claimed, previous_status). A PO that is already placed, or being submitted by
+        another worker of this run or, within CLAIM_TIMEOUT, by another process, is not claimed.
+        A PO left 'submitting' longer than that by an earlier run is re-claimed with
+        previous_status 'submitting': its outcome is unknown, so the caller must check the API
+        before sending it again.
+        The read and the write happen in one IMMEDIATE transaction, so two processes sharing
+        the database can't both claim the same PO.
+        """
+        now = time.time()
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.conn.execute('SELECT status, run_id, updated_at FROM orders WHERE po_num = ?',
+                                        (po_num,)).fetchone()
+                previous_status = row[0] if row else None
+                in_flight = previous_status == SUBMITTING and (row[1] == self.run_id or now - row[2] < CLAIM_TIMEOUT)
+                if previous_status == PLACED or in_flight:
+                    self.conn.rollback()
+                    return False, previous_status
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO orders (po_num, status, run_id, file, error, updated_at) VALUES (?, ?, ?, ?, NULL, ?)',
+                    (po_num, SUBMITTING, self.run_id, file, now)
+                )
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+            return True, previous_status
+
+    def _set_status(self, po_num, status, error=None, order_number=None):
+        with self.lock:
+            self.conn.execute(
+                'UPDATE orders SET status = ?, error = ?, order_number = COALESCE(?, order_number), updated_at = ? '
+                'WHERE po_num = ?',
+                (status, error, order_number, time.time(), po_num)
+            )
+            self.conn.commit()
+
+    def mark_placed(self, po_num, order_number=None):
+        self._set_status(po_num, PLACED, order_number=order_number)
+
+    def mark_failed(self, po_num, error):
+        self._set_status(po_num, FAILED, error)
+
+    def status(self, po_num):
+        with self.lock:
+            row = self.conn.execute('SELECT status FROM orders WHERE po_num = ?', (po_num,)).fetchone()
+        return row[0] if row else None
+
+    def order_number(self, po_num):
+        with self.lock:
+            row = self.conn.execute('SELECT order_number FROM orders WHERE po_num = ?', (po_num,)).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,69 @@
+import json
+from utils.db_utils import connect_db
+
+class InventorySnapshot:
+    """
+    Last exported state of every inventory item, keyed by itemcode (or sku when there is no itemcode).
+    Each export run compares every row against the snapshot; rows not seen during the run are
+    reported as removed. Nothing is persisted until commit() is called.
+    """
+
+    def __init__(self, name='inventory_snapshot'):
+        self.conn = connect_db(name)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS items (
+                key TEXT PRIMARY KEY,
+                row TEXT NOT NULL,
+                seen INTEGER NOT NULL
+            )
+        ''')
+        self.conn.commit()
+        row = self.conn.execute('SELECT COALESCE(MAX(seen), 0) FROM items').fetchone()
+        self.run_id = row[0] + 1
+        self.added = 0
+        self.changed = 0
+        self.removed = 0
+
+    def compare(self, key, row):
+        """
+        Record `row` (any JSON-serializable value) under `key`.
+        Returns 'added', 'changed' or None when the row is identical to the snapshot.
+        """
+        row_json = json.dumps(row, sort_keys=True)
+        existing = self.conn.execute('SELECT row FROM items WHERE key = ?', (key,)).fetchone()
+        self.conn.execute(
+            'INSERT OR REPLACE INTO items (key, row, seen) VALUES (?, ?, ?)',
+            (key, row_json, self.run_id)
+        )
+        if existing is None:
+            self.added += 1
+            return 'added'
+        if existing[0] != row_json:
+            self.changed += 1
+            return 'changed'
+        return None
+
+    def iter_removed(self):
+        """
+        Yield (key, row) for every item that was not seen during this run.
+        """
+        cursor = self.conn.execute('SELECT key, row FROM items WHERE seen != ?', (self.run_id,))
+        for key, row_json in cursor:
+            yield key, json.loads(row_json)
+
+    def commit(self):
+        self.removed = self.conn.execute('DELETE FROM items WHERE seen != ?', (self.run_id,)).rowcount
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    @property
+    def has_changes(self):
+        return bool(self.added or self.changed or self.removed)
+
+    def summary(self):
+        return f"added: {self.added}, removed: {self.removed}, changed: {self.changed}"
+
+    def close(self):
+        self.conn.close()
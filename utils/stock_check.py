@@ -0,0 +1,151 @@
+import os
+import time
+import threading
+from utils.inventory_outputs import InventoryIndex
+from utils.job_utils import run_reported_job
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# off, flag (warn and place anyway) or reject (hold the PO back)
+STOCK_CHECK_MODE = os.getenv('ORDER_STOCK_CHECK', 'flag').lower()
+# an index older than this (seconds) is refreshed in the background, and only flags problems;
+# keep the stock job's schedule (STOCK_INTERVAL, com.fromuth.stock.plist) inside it
+STOCK_CHECK_MAX_AGE = int(os.getenv('ORDER_STOCK_MAX_AGE', '900'))
+
+_refresh_lock = threading.Lock()
+_refresh_thread = None
+# the refresh thread dies with the process, so only resident processes turn this on
+_background_refresh = False
+
+def enable_background_refresh():
+    """
+    Let StockCheck refresh a stale index in the background. Called by the long-running daemon
+    and order watcher; one-shot runs leave the refresh to the scheduled `stock` job.
+    """
+    global _background_refresh
+    _background_refresh = True
+
+class StockCheck:
+    """
+    Pre-flight check of order lines against the local inventory index (inventory_index.db),
+    so unknown SKUs and lines with too little stock are caught without an API call.
+    When the index is older than `max_age`, problems are only flagged, since the index may be
+    behind; in a resident process (see enable_background_refresh) `refresh`, a quantity-only
+    inventory export, is also started on a background thread under the 'stock' job lock.
+    """
+
+    def __init__(self, index_file, refresh=None, mode=STOCK_CHECK_MODE, max_age=STOCK_CHECK_MAX_AGE):
+        self.index_file = index_file
+        self.refresh = refresh
+        self.mode = mode
+        self.max_age = max_age
+        self.index = None
+        self.index_mtime = None
+        self.lookups = {}  # sku -> lookup result for the current index file
+        self.reserved = {}  # sku -> quantity sent in orders since the index was last updated
+
+    @property
+    def enabled(self):
+        return self.mode in ('flag', 'reject')
+
+    def age(self):
+        try:
+            return time.time() - os.path.getmtime(self.index_file)
+        except OSError:
+            return None
+
+    @property
+    def fresh(self):
+        age = self.age()
+        return age is not None and age <= self.max_age
+
+    @property
+    def rejects(self):
+        return self.mode == 'reject' and self.fresh
+
+    def ensure_fresh(self):
+        """
+        Start a background refresh of a stale index, unless one is already running or this
+        process won't live long enough to finish it.
+        """
+        global _refresh_thread
+        age = self.age()
+        # a missing index can only be built by a full export, which is too slow to run here
+        if not _background_refresh or not self.enabled or self.refresh is None or age is None or age <= self.max_age:
+            return
+        with _refresh_lock:
+            if _refresh_thread is not None and _refresh_thread.is_alive():
+                return
+            print(f"inventory index is {age / 60:.0f} minutes old, refreshing it in the background")
+            _refresh_thread = threading.Thread(
+                target=lambda: print(f"job {run_reported_job('stock', self.refresh)}"), name='stock-refresh', daemon=True
+            )
+            _refresh_thread.start()
+
+    def _open(self):
+        try:
+            mtime = os.path.getmtime(self.index_file)
+        except OSError:
+            self.close()
+            return None
+        # the full export replaces the file and the stock refresh updates it in place; either way start over
+        if mtime != self.index_mtime:
+            self.close()
+            self.index = InventoryIndex(self.index_file)
+            self.index_mtime = mtime
+        return self.index
+
+    def _lookup(self, sku):
+        if sku not in self.lookups:
+            self.lookups[sku] = self.index.lookup(sku)
+        return self.lookups[sku]
+
+    def check(self, items):
+        """
+        Return a description of every line in `items` ({'sku', 'quantity'} dicts) that is
+        unknown to the index or short on stock. Empty if everything looks fine, or if there
+        is no index to check against yet.
+        """
+        if not self.enabled or self._open() is None:
+            return []
+        problems = []
+        for item in items:
+            info = self._lookup(item['sku'])
+            if info is None:
+                problems.append(f"{item['sku']}: unknown SKU")
+                continue
+            try:
+                in_stock = int(info['inventory'])
+            except (TypeError, ValueError):
+                continue  # no stock figure to check against
+            available = in_stock - self.reserved.get(item['sku'], 0)
+            if available < item['quantity']:
+                problems.append(f"{item['sku']}: {available} available, {item['quantity']} ordered")
+        return problems
+
+    def reserve(self, items):
+        """
+        Count the lines of an order being placed against the stock seen by later checks.
+        """
+        for item in items:
+            self.reserved[item['sku']] = self.reserved.get(item['sku'], 0) + item['quantity']
+
+    def release(self, items):
+        """
+        Undo reserve() for an order that ended up not being placed.
+        """
+        for item in items:
+            remaining = self.reserved.get(item['sku'], 0) - item['quantity']
+            if remaining > 0:
+                self.reserved[item['sku']] = remaining
+            else:
+                self.reserved.pop(item['sku'], None)
+
+    def close(self):
+        if self.index is not None:
+            self.index.close()
+        self.index = None
+        self.index_mtime = None
+        self.lookups = {}
+        self.reserved = {}
@@ -0,0 +1,105 @@
+import os
+import json
+import time
+from utils.db_utils import connect_db
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HOUR = 3600
+
+# states where tracking is imminent: always re-check
+SHIPPING_STATES = {'SHIPPED', 'PARTIALLY_SHIPPED', 'INVOICED', 'COMPLETE', 'COMPLETED'}
+NOT_FOUND = 'NOT_FOUND'
+
+NEW_ORDER_AGE = 4 * HOUR    # orders first seen this recently can't have shipped yet
+NEW_ORDER_TTL = 3 * HOUR
+STALE_STATE_AGE = 3 * 24 * HOUR  # orders stuck in the same state this long are polled rarely
+STALE_STATE_TTL = 12 * HOUR
+NOT_FOUND_TTL = 6 * HOUR
+DEFAULT_TTL = float(os.getenv('TRACKING_DEFAULT_TTL', str(2 * HOUR)))
+
+def state_ttl(state, first_seen, state_since, now):
+    """
+    How long (seconds) a looked-up order state stays fresh before it's worth querying again.
+    """
+    if state and state.upper() in SHIPPING_STATES:
+        return 0
+    if state == NOT_FOUND:
+        return NOT_FOUND_TTL
+    if now - first_seen < NEW_ORDER_AGE:
+        return NEW_ORDER_TTL
+    if now - state_since > STALE_STATE_AGE:
+        return STALE_STATE_TTL
+    return DEFAULT_TTL
+
+class TrackingCache:
+    """
+    Last known API state of every untracked order, keyed by customer order number.
+    Used by get_tracking to skip orders whose state can't have changed since the last lookup.
+    Also keeps get_tracking's sheet cursor: the first row still waiting for tracking.
+    """
+
+    def __init__(self, name='tracking_cache'):
+        self.conn = connect_db(name)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS orders (
+                customer_order_number TEXT PRIMARY KEY,
+                state TEXT,
+                first_seen REAL NOT NULL,
+                state_since REAL NOT NULL,
+                checked_at REAL NOT NULL
+            )
+        ''')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.conn.commit()
+
+    def sheet_cursor(self):
+        """
+        Return {'row', 'anchor', 'full_scan_at'} saved by the last sync, or None.
+        anchor is the PO that was in `row`, so a cursor invalidated by rows being moved or
+        deleted can be detected.
+        """
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'sheet_cursor'").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_sheet_cursor(self, row, anchor, full_scan_at):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('sheet_cursor', ?)",
+            (json.dumps({'row': row, 'anchor': anchor, 'full_scan_at': full_scan_at}),)
+        )
+
+    def is_fresh(self, customer_order_number, now=None):
+        now = now or time.time()
+        row = self.conn.execute(
+            'SELECT state, first_seen, state_since, checked_at FROM orders WHERE customer_order_number = ?',
+            (customer_order_number,)
+        ).fetchone()
+        if row is None:
+            return False
+        state, first_seen, state_since, checked_at = row
+        return now - checked_at < state_ttl(state, first_seen, state_since, now)
+
+    def record(self, customer_order_number, state, now=None):
+        now = now or time.time()
+        row = self.conn.execute(
+            'SELECT state, first_seen, state_since FROM orders WHERE customer_order_number = ?',
+            (customer_order_number,)
+        ).fetchone()
+        first_seen, state_since = now, now
+        if row is not None:
+            first_seen = row[1]
+            state_since = row[2] if row[0] == state else now
+        self.conn.execute(
+            'INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?)',
+            (customer_order_number, state, first_seen, state_since, now)
+        )
+
+    def forget(self, customer_order_number):
+        self.conn.execute('DELETE FROM orders WHERE customer_order_number = ?', (customer_order_number,))
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
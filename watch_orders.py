@@ -0,0 +1,104 @@
+from utils.ftp_utils import *
+from post_orders import process_order_files
+from utils.gsheet_utils import get_sheet_session
+from utils.stock_check import enable_background_refresh
+from utils.job_utils import run_job
+from dotenv import load_dotenv
+import logging
+import time
+import sys
+import os
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ORDER_POLL_INTERVAL = int(os.getenv('ORDER_POLL_INTERVAL', '15'))
+
+class OrderWatcher:
+    """
+    Polls REMOTE_ORDERS_DIR over one long-lived FTP connection and processes order files
+    as soon as they are fully written.
+    A file only counts as complete once two consecutive polls report the same size and
+    modify time, so a file still being uploaded is left alone until it stops changing.
+    """
+
+    def __init__(self, sheet=None):
+        self.sheet = sheet
+        self.ftp = None
+        self.last_seen = {}  # file name -> fingerprint from the previous poll
+
+    def _connection(self):
+        if self.ftp is None:
+            self.ftp = connect_ftp()
+        return self.ftp
+
+    def _drop_connection(self):
+        if self.ftp is not None:
+            try:
+                self.ftp.close()
+            finally:
+                self.ftp = None
+
+    def stable_files(self, fingerprints):
+        stable = [name for name, fingerprint in fingerprints.items() if self.last_seen.get(name) == fingerprint]
+        self.last_seen = fingerprints
+        return sorted(stable)
+
+    def poll_once(self):
+        """
+        List the orders directory once and download, archive and process any stable files.
+        A file that fails to download or archive is skipped and retried on a later poll;
+        the files that did go through are still processed.
+        Returns False if the FTP couldn't be reached, a file failed or processing failed.
+        """
+        ftp = self._connection()
+        if not ftp:
+            return False
+
+        try:
+            ready = self.stable_files(list_order_fingerprints(ftp))
+            if ready:
+                ftp.cwd(REMOTE_ORDERS_DIR)
+        except Exception as e:
+            logger.error(f"error polling FTP orders: {e}")
+            self._drop_connection()
+            return False
+
+        downloaded_files = []
+        failed = False
+        for file_name in ready:
+            try:
+                download_file_resumable(ftp, file_name)
+                archive_file_on_ftp(ftp, file_name)
+                downloaded_files.append(file_name)
+                self.last_seen.pop(file_name, None)
+            except Exception as e:
+                logger.error(f"error downloading {file_name}: {e}")
+                failed = True
+
+        success = not failed
+        if downloaded_files:
+            logger.info(f"new order files: {downloaded_files}")
+            success = process_order_files(downloaded_files, self.sheet or get_sheet_session().sheet) and success
+        if failed:
+            # start the next poll on a fresh connection in case this one is broken
+            self._drop_connection()
+        return success
+
+    def run_forever(self, interval=ORDER_POLL_INTERVAL):
+        while True:
+            start = time.monotonic()
+            # under the 'orders' job lock, like the daemon and main.py, so a poll never overlaps
+            # another process downloading and placing the same files
+            result = run_job('orders', self.poll_once)
+            if not result.ok:
+                print(f"job {result}")
+            time.sleep(max(0, interval - (time.monotonic() - start)))
+
+if __name__ == '__main__':
+    enable_background_refresh()
+    try:
+        OrderWatcher().run_forever()
+    except KeyboardInterrupt:
+        sys.exit(0)